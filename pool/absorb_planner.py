@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from blspy import G2Element
+from chia.consensus.condition_costs import ConditionCost
+from chia.rpc.full_node_rpc_client import FullNodeRpcClient
+from chia.types.blockchain_format.program import INFINITE_COST
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_solution import CoinSolution
+from chia.types.condition_opcodes import ConditionOpcode
+from chia.types.spend_bundle import SpendBundle
+
+log = logging
+
+# Each reward absorbed by create_absorb_transaction adds the spend of the singleton and the spend of the reward
+SPENDS_PER_ABSORB = 2
+
+
+def estimate_cost(coin_solution: CoinSolution, cost_per_byte: int) -> int:
+    """
+    Estimates the cost of a spend in a block: running its puzzle, the coins it creates, and its size. Absorb spends
+    have no signature conditions.
+    """
+    clvm_cost, conditions = coin_solution.puzzle_reveal.run_with_cost(INFINITE_COST, coin_solution.solution)
+    create_coins = sum(
+        1 for condition in conditions.as_iter() if condition.first().as_atom() == ConditionOpcode.CREATE_COIN
+    )
+    return clvm_cost + create_coins * ConditionCost.CREATE_COIN.value + len(bytes(coin_solution)) * cost_per_byte
+
+
+def to_spend_bundle(groups: Dict[bytes32, List[CoinSolution]]) -> SpendBundle:
+    # Absorb spends are not signed
+    return SpendBundle([coin_solution for group in groups.values() for coin_solution in group], G2Element())
+
+
+def estimate_absorb_costs(
+    absorb_spends: Dict[bytes32, List[CoinSolution]], cost_per_byte: int
+) -> Dict[bytes32, List[int]]:
+    """
+    :return: the cost of each absorb (SPENDS_PER_ABSORB spends) of each singleton, by launcher id
+    """
+    return {
+        launcher_id: [
+            sum(
+                estimate_cost(coin_solution, cost_per_byte)
+                for coin_solution in coin_solutions[i : i + SPENDS_PER_ABSORB]
+            )
+            for i in range(0, len(coin_solutions), SPENDS_PER_ABSORB)
+        ]
+        for launcher_id, coin_solutions in absorb_spends.items()
+    }
+
+
+async def plan_absorb_bundles(
+    absorb_spends: Dict[bytes32, List[CoinSolution]], max_bundle_cost: int, cost_per_byte: int
+) -> List[Dict[bytes32, List[CoinSolution]]]:
+    """
+    Same as pack_absorb_bundles, estimating the costs of the spends in a worker thread, since it runs their puzzles
+    """
+    absorb_costs: Dict[bytes32, List[int]] = await asyncio.get_event_loop().run_in_executor(
+        None, estimate_absorb_costs, absorb_spends, cost_per_byte
+    )
+    return pack_absorb_bundles(absorb_spends, absorb_costs, max_bundle_cost)
+
+
+def pack_absorb_bundles(
+    absorb_spends: Dict[bytes32, List[CoinSolution]], absorb_costs: Dict[bytes32, List[int]], max_bundle_cost: int
+) -> List[Dict[bytes32, List[CoinSolution]]]:
+    """
+    Packs the absorb spends of many singletons in as few spend bundles as possible, each costing at most
+    max_bundle_cost. The spends of a singleton form a chain, each spending the singleton coin created by the previous
+    one, so they always go in the same bundle. If they cost too much for one bundle, only the first ones are
+    kept, the remaining rewards are absorbed in a later cycle.
+    :param absorb_spends: the coin solutions of create_absorb_transaction, by launcher id
+    :param absorb_costs: the costs of estimate_absorb_costs
+    :return: the spends of each bundle, by launcher id
+    """
+    groups: List[Tuple[int, bytes32, List[CoinSolution]]] = []
+    for launcher_id, coin_solutions in absorb_spends.items():
+        group_cost = 0
+        group: List[CoinSolution] = []
+        for i, absorb_cost in enumerate(absorb_costs[launcher_id]):
+            if group_cost + absorb_cost > max_bundle_cost:
+                log.info(
+                    f"Absorbing {i} of {len(absorb_costs[launcher_id])} rewards of {launcher_id}, the others do not "
+                    f"fit in a bundle"
+                )
+                break
+            group_cost += absorb_cost
+            group += coin_solutions[i * SPENDS_PER_ABSORB : (i + 1) * SPENDS_PER_ABSORB]
+        if len(group) > 0:
+            groups.append((group_cost, launcher_id, group))
+
+    # First fit decreasing
+    groups.sort(key=lambda g: g[0], reverse=True)
+    bundle_costs: List[int] = []
+    bundles: List[Dict[bytes32, List[CoinSolution]]] = []
+    for group_cost, launcher_id, group in groups:
+        for i, bundle_cost in enumerate(bundle_costs):
+            if bundle_cost + group_cost <= max_bundle_cost:
+                bundle_costs[i] += group_cost
+                bundles[i][launcher_id] = group
+                break
+        else:
+            bundle_costs.append(group_cost)
+            bundles.append({launcher_id: group})
+    return bundles
+
+
+async def submit_absorb_bundles(
+    node_rpc_client: FullNodeRpcClient,
+    bundles: List[Dict[bytes32, List[CoinSolution]]],
+    concurrency: int,
+    timeout: Optional[float] = None,
+) -> List[Tuple[List[bytes32], bytes32, Optional[str]]]:
+    """
+    Submits the bundles of plan_absorb_bundles, at most concurrency at a time, each within timeout seconds. When a
+    bundle of several singletons is rejected, for example because one of them was spent in the meantime, the spends
+    of each singleton are submitted again on their own, so that the others are still absorbed.
+    :return: for each submitted bundle, its launcher ids, its name, and None if it was accepted, or the error
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[Tuple[List[bytes32], bytes32, Optional[str]]] = []
+
+    async def push(groups: Dict[bytes32, List[CoinSolution]]) -> Optional[str]:
+        spend_bundle: SpendBundle = to_spend_bundle(groups)
+        async with semaphore:
+            try:
+                push_tx_response: Dict = await asyncio.wait_for(node_rpc_client.push_tx(spend_bundle), timeout)
+                error: Optional[str] = None if push_tx_response["status"] == "SUCCESS" else str(push_tx_response)
+            except asyncio.TimeoutError:
+                error = "Timed out"
+            except Exception as e:
+                error = str(e)
+        results.append((list(groups.keys()), spend_bundle.name(), error))
+        return error
+
+    async def submit(groups: Dict[bytes32, List[CoinSolution]]) -> None:
+        error: Optional[str] = await push(groups)
+        if error is not None and len(groups) > 1:
+            await asyncio.gather(*[push({launcher_id: group}) for launcher_id, group in groups.items()])
+
+    await asyncio.gather(*[submit(groups) for groups in bundles])
+    return results
@@ -0,0 +1,47 @@
+from typing import Dict
+
+from blspy import G1Element
+from chia.util.lru_cache import LRUCache
+
+
+class ElementCache:
+    """
+    Bounded cache of parsed BLS elements, keyed by their serialized bytes. Parsing validates that the point is on the
+    curve and in the right subgroup, which is much more expensive than a dictionary lookup, and the pool parses the
+    same few farmer keys over and over. Signatures are unique per request, so they are never cached.
+    """
+
+    def __init__(self, element_type, capacity: int):
+        self.element_type = element_type
+        self.cache = LRUCache(capacity)
+        self.hits = 0
+        self.misses = 0
+
+    def set_capacity(self, capacity: int) -> None:
+        """
+        Drops the cached elements, meant to be called once at startup.
+        """
+        self.cache = LRUCache(capacity)
+
+    def from_bytes(self, data: bytes):
+        data = bytes(data)
+        element = self.cache.get(data)
+        if element is not None:
+            self.hits += 1
+            return element
+        self.misses += 1
+        element = self.element_type.from_bytes(data)
+        self.cache.put(data, element)
+        return element
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.cache.cache),
+            "capacity": self.cache.capacity,
+        }
+
+
+# Farmer public keys, shared by the store and the pool. The capacity is set from the config when the pool starts.
+g1_element_cache = ElementCache(G1Element, 20000)
@@ -0,0 +1,57 @@
+import asyncio
+import heapq
+import math
+import time
+from typing import Dict, Generic, List, TypeVar
+
+T = TypeVar("T")
+
+
+class ConfirmationScheduler(Generic[T]):
+    """
+    Bucketed timer for partials waiting for their confirmation delay. Items are put in buckets of tick seconds by due
+    time, and next_batch returns everything in all buckets that are due at once, so the caller can process them as
+    one batch instead of sleeping and starting a task per item. Items are released at most one tick late, never early.
+    """
+
+    def __init__(self, tick: float):
+        self.tick = tick
+        self.buckets: Dict[int, List[T]] = {}
+        self.bucket_heap: List[int] = []
+        self.size = 0
+        self.added = asyncio.Event()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, due_time: float, item: T) -> None:
+        bucket = math.ceil(due_time / self.tick)
+        if bucket not in self.buckets:
+            self.buckets[bucket] = []
+            heapq.heappush(self.bucket_heap, bucket)
+        self.buckets[bucket].append(item)
+        self.size += 1
+        self.added.set()
+
+    def pop_due(self, now: float) -> List[T]:
+        batch: List[T] = []
+        while len(self.bucket_heap) > 0 and self.bucket_heap[0] * self.tick <= now:
+            batch.extend(self.buckets.pop(heapq.heappop(self.bucket_heap)))
+        self.size -= len(batch)
+        return batch
+
+    async def next_batch(self) -> List[T]:
+        """
+        Waits until at least one bucket is due, and returns the items of all due buckets.
+        """
+        while True:
+            batch = self.pop_due(time.time())
+            if len(batch) > 0:
+                return batch
+            self.added.clear()
+            timeout = None if len(self.bucket_heap) == 0 else self.bucket_heap[0] * self.tick - time.time()
+            try:
+                # Wakes up early if an item is added, in case it is due before the earliest bucket
+                await asyncio.wait_for(self.added.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
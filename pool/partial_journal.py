@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+from typing import Dict, List, Tuple
+
+RECORD_ADDED = 1
+RECORD_CONFIRMED = 2
+
+# Record type, sequence number, length of the data that follows
+RECORD_HEADER = struct.Struct(">BQI")
+
+
+class PartialJournal:
+    """
+    Append-only on-disk journal of the partials that were accepted but not confirmed yet, so that they survive a
+    restart. Records are buffered in memory and written and fsynced by sync, which the pool calls every
+    fsync_interval seconds, so appending never waits for the disk. A crash loses at most the last fsync_interval
+    seconds of partials.
+
+    The journal is split in segment files of about segment_seconds each. A segment is deleted once it and all older
+    segments only hold confirmed partials. Confirmations are journaled as well, so a replay after a crash does not
+    confirm a partial twice.
+    """
+
+    def __init__(self, directory: str, fsync_interval: float, segment_seconds: float = 600):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.segment_seconds = segment_seconds
+        self.next_seq = 0
+        self.next_segment = 0
+        self.buffer = bytearray()
+        self.file = None
+        self.segment_start = 0.0
+        # Segment file names, oldest first, and the number of unconfirmed partials in each
+        self.segments: List[str] = []
+        self.unconfirmed: Dict[str, int] = {}
+        self.segment_of_seq: Dict[int, str] = {}
+        self.sync_lock = asyncio.Lock()
+        self.appended = 0
+        self.syncs = 0
+
+    def open(self) -> List[Tuple[int, bytes]]:
+        """
+        Reads the partials that were not confirmed before the last shutdown or crash, and starts a new journal with
+        only those. They keep their sequence numbers, so if the pool stops after the new segment is written but
+        before the old ones are deleted, the next start reads each partial twice under the same number and replays
+        it once.
+        :return: the (sequence number, data) of each unconfirmed partial, in the order they were added
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        old_segments = sorted(name for name in os.listdir(self.directory) if name.endswith(".journal"))
+        if len(old_segments) > 0:
+            self.next_segment = int(old_segments[-1].split(".")[0]) + 1
+        pending: Dict[int, bytes] = {}
+        for name in old_segments:
+            for record_type, seq, data in self._read_segment(os.path.join(self.directory, name)):
+                if record_type == RECORD_ADDED:
+                    pending[seq] = data
+                elif record_type == RECORD_CONFIRMED:
+                    pending.pop(seq, None)
+                self.next_seq = max(self.next_seq, seq + 1)
+
+        self._new_segment()
+        replayed: List[Tuple[int, bytes]] = sorted(pending.items())
+        for seq, data in replayed:
+            self._add(seq, data)
+        self._write_and_fsync(self.file, bytes(self.buffer))
+        self.buffer.clear()
+        for name in old_segments:
+            os.remove(os.path.join(self.directory, name))
+        if len(replayed) > 0:
+            logging.info(f"Replayed {len(replayed)} unconfirmed partials from the journal")
+        return replayed
+
+    @staticmethod
+    def _read_segment(path: str) -> List[Tuple[int, int, bytes]]:
+        with open(path, "rb") as f:
+            contents = f.read()
+        records: List[Tuple[int, int, bytes]] = []
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(contents):
+            record_type, seq, length = RECORD_HEADER.unpack_from(contents, offset)
+            if offset + RECORD_HEADER.size + length > len(contents):
+                break
+            offset += RECORD_HEADER.size
+            records.append((record_type, seq, contents[offset : offset + length]))
+            offset += length
+        if offset != len(contents):
+            # The last record was only partially written before a crash, it was never fsynced
+            logging.warning(f"Ignoring {len(contents) - offset} bytes at the end of {path}")
+        return records
+
+    def _new_segment(self) -> None:
+        # Zero padded, so that the file names sort in the order of the segments
+        name = f"{self.next_segment:020d}.journal"
+        self.next_segment += 1
+        self.file = open(os.path.join(self.directory, name), "ab")
+        self.segments.append(name)
+        self.unconfirmed[name] = 0
+        self.segment_start = time.time()
+
+    def append(self, data: bytes) -> int:
+        """
+        :return: the sequence number of the partial, to pass to confirm
+        """
+        seq = self.next_seq
+        self.next_seq += 1
+        self._add(seq, data)
+        self.appended += 1
+        return seq
+
+    def _add(self, seq: int, data: bytes) -> None:
+        self.buffer += RECORD_HEADER.pack(RECORD_ADDED, seq, len(data)) + data
+        segment = self.segments[-1]
+        self.segment_of_seq[seq] = segment
+        self.unconfirmed[segment] += 1
+
+    def confirm(self, seq: int) -> None:
+        segment = self.segment_of_seq.pop(seq, None)
+        if segment is None:
+            return
+        self.buffer += RECORD_HEADER.pack(RECORD_CONFIRMED, seq, 0)
+        self.unconfirmed[segment] -= 1
+
+    @staticmethod
+    def _write_and_fsync(file, data: bytes) -> None:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+    async def sync(self) -> None:
+        """
+        Writes and fsyncs everything appended or confirmed so far, in a thread, and deletes the segments that are
+        no longer needed.
+        """
+        async with self.sync_lock:
+            file, data = self.file, bytes(self.buffer)
+            self.buffer.clear()
+            # Partials appended from now on belong to the new segment, this data is still written to the old one
+            rotate = time.time() - self.segment_start > self.segment_seconds
+            if rotate:
+                self._new_segment()
+            if len(data) > 0:
+                await asyncio.get_event_loop().run_in_executor(None, self._write_and_fsync, file, data)
+                self.syncs += 1
+            if rotate:
+                file.close()
+
+            while len(self.segments) > 1 and self.unconfirmed[self.segments[0]] == 0:
+                name = self.segments.pop(0)
+                del self.unconfirmed[name]
+                os.remove(os.path.join(self.directory, name))
+
+    async def sync_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.sleep(self.fsync_interval)
+                await self.sync()
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logging.error(f"Error syncing the partial journal: {e}")
+
+    async def close(self) -> None:
+        await self.sync()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "appended": self.appended,
+            "unconfirmed": len(self.segment_of_seq),
+            "segments": len(self.segments),
+            "syncs": self.syncs,
+        }
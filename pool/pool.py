@@ -1,8 +1,8 @@
 import asyncio
 import logging
+import struct
 import time
 import traceback
-from asyncio import Task
 from math import floor
 from typing import Dict, Optional, Set, List, Tuple
 
@@ -22,7 +22,6 @@ from chia.protocols.pool_protocol import (
     POOL_PROTOCOL_VERSION,
 )
 from chia.rpc.wallet_rpc_client import WalletRpcClient
-from chia.types.blockchain_format.coin import Coin
 from chia.types.coin_record import CoinRecord
 from chia.types.coin_solution import CoinSolution
 from chia.util.bech32m import decode_puzzle_hash
@@ -34,24 +33,32 @@ from chia.rpc.full_node_rpc_client import FullNodeRpcClient
 from chia.full_node.signage_point import SignagePoint
 from chia.types.end_of_slot_bundle import EndOfSubSlotBundle
 from chia.types.blockchain_format.sized_bytes import bytes32
-from chia.consensus.pot_iterations import calculate_iterations_quality
-from chia.util.lru_cache import LRUCache
 from chia.wallet.transaction_record import TransactionRecord
 from chia.pools.pool_puzzles import (
-    get_most_recent_singleton_coin_from_coin_solution,
     get_delayed_puz_info_from_launcher_spend,
     launcher_id_to_p2_puzzle_hash,
 )
 
+from absorb_planner import plan_absorb_bundles, submit_absorb_bundles
+from bls_cache import g1_element_cache
+from confirmation_scheduler import ConfirmationScheduler
 from difficulty_adjustment import get_new_difficulty
-from singleton import create_absorb_transaction, get_singleton_state, get_coin_spend
-from store import FarmerRecord, PoolStore
+from singleton import SingletonFollower, create_absorb_transaction, get_coin_spend, get_removed_coin_names
+from store import FarmerRecord, FarmerHotState, PoolStore
+from partial_journal import PartialJournal
+from pool_parent_index import PoolParentIndex
+from proof_verifier import ProofVerifier
+from recent_proofs import RecentProofs
+from reward_scanner import RewardScanner
+from signage_point_cache import SignagePointCache
+from signature_verifier import SignatureVerifier
+from striped_lock import StripedLock
 from util import error_dict
 
 
 class Pool:
     def __init__(self, config: Dict, constants: ConsensusConstants):
-        self.follow_singleton_tasks: Dict[bytes32, asyncio.Task] = {}
+        self.singleton_follower: Optional[SingletonFollower] = None
         self.log = logging
         # If you want to log to a file: use filename='example.log', encoding='utf-8'
         self.log.basicConfig(level=logging.INFO)
@@ -72,6 +79,35 @@ class Pool:
 
         self.store: Optional[PoolStore] = None
 
+        # Serializes the updates of each farmer (difficulty, points, registration), without making unrelated farmers
+        # wait for each other
+        self.farmer_locks = StripedLock()
+
+        # Maximum number of decoded farmer records kept in memory. Size it to (at least) the number of active farmers,
+        # the hit rate is logged with the peak.
+        self.farmer_record_cache_size: int = pool_config["farmer_record_cache_size"]
+
+        # Maximum number of parsed farmer public keys kept in memory, the hit rate is logged with the peak
+        g1_element_cache.set_capacity(pool_config["bls_key_cache_size"])
+
+        # Confirmed partials are written to the database in batches of up to partial_batch_size, at least every
+        # partial_flush_interval seconds. A crash can lose at most one batch of points. db_synchronous is the sqlite
+        # synchronous level (0=OFF, 1=NORMAL, 2=FULL) used for every commit.
+        self.partial_batch_size: int = pool_config["partial_batch_size"]
+        self.partial_flush_interval: float = pool_config["partial_flush_interval"]
+        self.db_synchronous: int = pool_config["db_synchronous"]
+
+        # Number of read-only database connections used by lookups (GET /farmer, GET /login, partial validation), in
+        # addition to the single writer connection. 0 runs everything on the writer.
+        self.db_read_connections: int = pool_config["db_read_connections"]
+
+        # Raw partials older than partial_retention_seconds are compacted into per-farmer hourly rollups, every
+        # partial_retention_interval seconds. Keep the window well above the time a farmer needs to submit
+        # number_of_partials_target partials, since difficulty adjustment only looks at raw partials.
+        self.partial_retention_seconds: int = pool_config["partial_retention_seconds"]
+        self.partial_retention_interval: int = pool_config["partial_retention_interval"]
+        self.partial_retention_batch_size: int = pool_config["partial_retention_batch_size"]
+
         self.pool_fee = pool_config["pool_fee"]
 
         # This number should be held constant and be consistent for every pool in the network. DO NOT CHANGE
@@ -86,8 +122,38 @@ class Pool:
         self.min_difficulty = uint64(pool_config["min_difficulty"])  # 10 difficulty is about 1 proof a day per plot
         self.default_difficulty: uint64 = uint64(pool_config["default_difficulty"])
 
-        self.pending_point_partials: Optional[asyncio.Queue] = None
-        self.recent_points_added: LRUCache = LRUCache(20000)
+        # Partials wait here until their partial_confirmation_delay is over. They are confirmed in batches, every
+        # partial_confirmation_tick seconds, checking up to partial_confirmation_concurrency signage points at the same
+        # time. The singletons of a batch are followed together. The partials of a singleton that the full node failed
+        # to look up are confirmed again partial_confirmation_retry_delay seconds later.
+        self.partial_confirmation_scheduler: Optional[ConfirmationScheduler] = None
+        self.partial_confirmation_tick: float = pool_config["partial_confirmation_tick"]
+        self.partial_confirmation_concurrency: int = pool_config["partial_confirmation_concurrency"]
+        self.partial_confirmation_retry_delay: float = pool_config["partial_confirmation_retry_delay"]
+
+        # Partials waiting for confirmation are also journaled to disk, and replayed when the pool starts. The journal
+        # is fsynced every partial_journal_fsync_interval seconds, a crash loses at most that many seconds of partials.
+        self.partial_journal = PartialJournal(
+            pool_config["partial_journal_directory"], pool_config["partial_journal_fsync_interval"]
+        )
+        self.partial_journal_sync_task: Optional[asyncio.Task] = None
+
+        # Signage point and end of sub slot lookups are shared by partial validation and confirmation. Entries are
+        # fetched again from the full node after signage_point_cache_ttl seconds or on a new peak. The ttl should be
+        # longer than partial_confirmation_delay. Partials for a signage point that the full node has not seen yet wait
+        # for it, polling the full node every signage_point_poll_interval seconds.
+        self.signage_point_cache = SignagePointCache(
+            self.get_signage_point_or_eos_from_node,
+            pool_config["signage_point_cache_ttl"],
+            pool_config["signage_point_poll_interval"],
+        )
+
+        # Number of worker processes that verify proofs of space, 0 verifies them on the event loop. Set it to about the
+        # number of cores not needed by the rest of the pool, ProofVerifier.get_stats reports queueing and timing.
+        self.proof_verifier = ProofVerifier(self.constants, pool_config["proof_verification_workers"])
+
+        # Verifies the partial signatures off the event loop
+        self.signature_verifier = SignatureVerifier()
 
         # The time in minutes for an authentication token to be valid. See "Farmer authentication" in SPECIFICATION.md
         self.authentication_token_timeout: uint8 = pool_config["authentication_token_timeout"]
@@ -118,19 +184,57 @@ class Pool:
         # reorg. That is why we have a time delay before changing any account points.
         self.partial_confirmation_delay: int = pool_config["partial_confirmation_delay"]
 
+        # Proofs of space received recently, to reject double submissions before validating them. A proof can only be
+        # on time for partial_time_limit, the window also covers the confirmation delay to be safe.
+        self.recent_proofs = RecentProofs(self.partial_time_limit + self.partial_confirmation_delay)
+
+        # Number of partials accepted, and rejected per PoolErrorCode name. Double submissions, unparseable requests
+        # and exceptions are counted apart, as DOUBLE_SUBMISSION, INVALID_REQUEST and SERVER_EXCEPTION.
+        self.partial_results: Dict[str, int] = {}
+
         # Only allow PUT /farmer per launcher_id every n seconds to prevent difficulty change attacks.
         self.farmer_update_blocked: set = set()
         self.farmer_update_cooldown_seconds: int = 600
 
+        # Latest validated state of each followed singleton, (tip, tip state, is pool member), kept up to date on each
+        # new peak by singleton_watch_loop, so that confirming partials does not look up singletons
+        self.singleton_membership: Dict[bytes32, Tuple[CoinSolution, PoolState, bool]] = {}
+        # Height and header hash of the last peak seen by singleton_watch_loop, None to check all the singletons
+        self.singleton_watch_height: Optional[uint32] = None
+        self.singleton_watch_header_hash: Optional[bytes32] = None
+        # Set by get_peak_loop when the peak changes
+        self.new_peak_event: Optional[asyncio.Event] = None
+
+        # Heights of the recent blocks by the parent id of their pool reward, to find the height of the rewards to claim
+        self.pool_parent_index = PoolParentIndex(self.constants.GENESIS_CHALLENGE)
+
         # These are the phs that we want to look for on chain, that we can claim to our pool
         self.scan_p2_singleton_puzzle_hashes: Set[bytes32] = set()
 
         # Don't scan anything before this height, for efficiency (for example pool start date)
         self.scan_start_height: uint32 = uint32(pool_config["scan_start_height"])
 
+        # Rewards are scanned incrementally from the last scanned height, which is kept in the database, querying
+        # reward_scan_chunk_size puzzle hashes per request. Set full_reward_rescan to scan from scan_start_height.
+        self.reward_scan_chunk_size: int = pool_config["reward_scan_chunk_size"]
+        self.full_reward_rescan: bool = pool_config["full_reward_rescan"]
+        self.reward_scanner: Optional[RewardScanner] = None
+
         # Interval for scanning and collecting the pool rewards
         self.collect_pool_rewards_interval = pool_config["collect_pool_rewards_interval"]
 
+        # The absorb spends of all the farmers are packed in spend bundles that cost at most this much, so that each
+        # fits in a block, and at most absorb_submit_concurrency bundles are submitted at a time
+        self.max_absorb_bundle_cost: int = pool_config["max_absorb_bundle_cost"]
+        self.absorb_submit_concurrency: int = pool_config["absorb_submit_concurrency"]
+
+        # The absorb transactions of at most claim_concurrency farmers are created at a time, and each farmer (and
+        # each submitted bundle) is given up on after claim_timeout seconds, to be retried in the next cycle
+        self.claim_concurrency: int = pool_config["claim_concurrency"]
+        self.claim_timeout: float = pool_config["claim_timeout"]
+        # Number of farmers claimed, skipped and failed, and duration of the last claim cycle
+        self.claim_stats: Dict[str, float] = {}
+
         # After this many confirmations, a transaction is considered final and irreversible
         self.confirmation_security_threshold = pool_config["confirmation_security_threshold"]
 
@@ -156,10 +260,13 @@ class Pool:
 
         # Tasks (infinite While loops) for different purposes
         self.confirm_partials_loop_task: Optional[asyncio.Task] = None
+        self.confirm_partial_batch_tasks: Set[asyncio.Task] = set()
         self.collect_pool_rewards_loop_task: Optional[asyncio.Task] = None
         self.create_payment_loop_task: Optional[asyncio.Task] = None
         self.submit_payment_loop_task: Optional[asyncio.Task] = None
         self.get_peak_loop_task: Optional[asyncio.Task] = None
+        self.partial_retention_loop_task: Optional[asyncio.Task] = None
+        self.singleton_watch_loop_task: Optional[asyncio.Task] = None
 
         self.node_rpc_client: Optional[FullNodeRpcClient] = None
         self.node_rpc_port = pool_config["node_rpc_port"]
@@ -167,8 +274,23 @@ class Pool:
         self.wallet_rpc_port = pool_config["wallet_rpc_port"]
 
     async def start(self):
-        self.store = await PoolStore.create()
-        self.pending_point_partials = asyncio.Queue()
+        self.store = await PoolStore.create(
+            farmer_record_cache_size=self.farmer_record_cache_size,
+            partial_batch_size=self.partial_batch_size,
+            partial_flush_interval=self.partial_flush_interval,
+            synchronous=self.db_synchronous,
+            recent_partials_size=self.number_of_partials_target,
+            read_connections=self.db_read_connections,
+        )
+        self.partial_confirmation_scheduler = ConfirmationScheduler(self.partial_confirmation_tick)
+        self.new_peak_event = asyncio.Event()
+        for seq, data in self.partial_journal.open():
+            points_received, due_time = struct.unpack_from(">Qd", data)
+            partial = PostPartialRequest.from_bytes(data[struct.calcsize(">Qd") :])
+            self.recent_proofs.add(partial.payload.proof_of_space.get_hash(), time.time())
+            self.partial_confirmation_scheduler.add(due_time, (partial, uint64(points_received), seq))
+        self.partial_journal_sync_task = asyncio.create_task(self.partial_journal.sync_loop())
+        await self.proof_verifier.start()
 
         self_hostname = self.config["self_hostname"]
         self.node_rpc_client = await FullNodeRpcClient.create(
@@ -177,7 +299,11 @@ class Pool:
         self.wallet_rpc_client = await WalletRpcClient.create(
             self.config["self_hostname"], uint16(self.wallet_rpc_port), DEFAULT_ROOT_PATH, self.config
         )
+        self.singleton_follower = SingletonFollower(self.node_rpc_client, self.confirmation_security_threshold)
         self.blockchain_state = await self.node_rpc_client.get_blockchain_state()
+        self.signage_point_cache.new_peak(self.get_peak_header_hash())
+        if self.blockchain_state["peak"] is not None:
+            self.pool_parent_index.update(self.blockchain_state["peak"].height)
         res = await self.wallet_rpc_client.log_in_and_skip(fingerprint=self.wallet_fingerprint)
         if not res["success"]:
             raise ValueError(f"Error logging in: {res['error']}. Make sure your config fingerprint is correct.")
@@ -186,18 +312,35 @@ class Pool:
         self.log.info(f"Obtaining balance: {res}")
 
         self.scan_p2_singleton_puzzle_hashes = await self.store.get_pay_to_singleton_phs()
+        self.reward_scanner = RewardScanner(
+            self.node_rpc_client,
+            self.store,
+            self.scan_start_height,
+            self.confirmation_security_threshold,
+            self.reward_scan_chunk_size,
+            self.full_reward_rescan,
+        )
+        await self.reward_scanner.start(self.scan_p2_singleton_puzzle_hashes)
 
         self.confirm_partials_loop_task = asyncio.create_task(self.confirm_partials_loop())
         self.collect_pool_rewards_loop_task = asyncio.create_task(self.collect_pool_rewards_loop())
         self.create_payment_loop_task = asyncio.create_task(self.create_payment_loop())
         self.submit_payment_loop_task = asyncio.create_task(self.submit_payment_loop())
         self.get_peak_loop_task = asyncio.create_task(self.get_peak_loop())
+        self.partial_retention_loop_task = asyncio.create_task(self.partial_retention_loop())
+        self.singleton_watch_loop_task = asyncio.create_task(self.singleton_watch_loop())
+        self.new_peak_event.set()
 
         self.pending_payments = asyncio.Queue()
 
     async def stop(self):
         if self.confirm_partials_loop_task is not None:
             self.confirm_partials_loop_task.cancel()
+        # A batch that is cut short could leave points buffered in the store while its partials stay unconfirmed in
+        # the journal, and they would be counted again on the next start. The batches in flight are finished instead.
+        if len(self.confirm_partial_batch_tasks) > 0:
+            self.log.info(f"Waiting for {len(self.confirm_partial_batch_tasks)} partial confirmation batches")
+            await asyncio.gather(*self.confirm_partial_batch_tasks, return_exceptions=True)
         if self.collect_pool_rewards_loop_task is not None:
             self.collect_pool_rewards_loop_task.cancel()
         if self.create_payment_loop_task is not None:
@@ -206,12 +349,30 @@ class Pool:
             self.submit_payment_loop_task.cancel()
         if self.get_peak_loop_task is not None:
             self.get_peak_loop_task.cancel()
+        if self.partial_retention_loop_task is not None:
+            self.partial_retention_loop_task.cancel()
+        if self.singleton_watch_loop_task is not None:
+            self.singleton_watch_loop_task.cancel()
+        if self.partial_journal_sync_task is not None:
+            self.partial_journal_sync_task.cancel()
 
         self.wallet_rpc_client.close()
         await self.wallet_rpc_client.await_closed()
         self.node_rpc_client.close()
         await self.node_rpc_client.await_closed()
-        await self.store.connection.close()
+        self.proof_verifier.stop()
+        await self.partial_journal.close()
+        await self.store.close()
+
+    def get_peak_header_hash(self) -> Optional[bytes32]:
+        peak = self.blockchain_state["peak"]
+        return None if peak is None else peak.header_hash
+
+    async def get_signage_point_or_eos_from_node(self, sp_hash: bytes32, is_eos: bool) -> Optional[Dict]:
+        if is_eos:
+            return await self.node_rpc_client.get_recent_signage_point_or_eos(None, sp_hash)
+        else:
+            return await self.node_rpc_client.get_recent_signage_point_or_eos(sp_hash, None)
 
     async def get_peak_loop(self):
         """
@@ -219,8 +380,22 @@ class Pool:
         """
         while True:
             try:
+                previous_peak_header_hash: Optional[bytes32] = self.get_peak_header_hash()
                 self.blockchain_state = await self.node_rpc_client.get_blockchain_state()
+                self.signage_point_cache.new_peak(self.get_peak_header_hash())
+                if self.get_peak_header_hash() != previous_peak_header_hash:
+                    if self.blockchain_state["peak"] is not None:
+                        self.pool_parent_index.update(self.blockchain_state["peak"].height)
+                    self.new_peak_event.set()
                 self.wallet_synced = await self.wallet_rpc_client.get_synced()
+                self.log.info(f"Partials received by result: {self.partial_results}")
+                self.log.info(f"Farmer record cache: {self.store.get_farmer_record_cache_stats()}")
+                self.log.info(f"BLS key cache: {g1_element_cache.get_stats()}")
+                self.log.info(f"Proof verifier: {self.proof_verifier.get_stats()}")
+                self.log.info(f"Signature verifier: {self.signature_verifier.get_stats()}")
+                self.log.info(f"Signage point cache: {self.signage_point_cache.get_stats()}")
+                self.log.info(f"Partial journal: {self.partial_journal.get_stats()}")
+                self.log.info(f"Last claim cycle: {self.claim_stats}")
                 await asyncio.sleep(30)
             except asyncio.CancelledError:
                 self.log.info("Cancelled get_peak_loop, closing")
@@ -229,6 +404,76 @@ class Pool:
                 self.log.error(f"Unexpected error in get_peak_loop: {e}")
                 await asyncio.sleep(30)
 
+    async def singleton_watch_loop(self):
+        """
+        On each new peak, updates the singletons that changed in the new blocks, so that singleton_membership is
+        always up to date.
+        """
+        while True:
+            try:
+                await self.new_peak_event.wait()
+                self.new_peak_event.clear()
+                await self.watch_singletons()
+            except asyncio.CancelledError:
+                self.log.info("Cancelled singleton_watch_loop, closing")
+                return
+            except Exception as e:
+                error_stack = traceback.format_exc()
+                self.log.error(f"Unexpected error in singleton_watch_loop: {e} {error_stack}")
+                # Checks all the singletons on the next peak, since some blocks may have been missed
+                self.singleton_watch_height = None
+                await asyncio.sleep(30)
+
+    async def watch_singletons(self):
+        peak = self.blockchain_state["peak"]
+        if peak is None:
+            return
+        if self.singleton_watch_header_hash == peak.header_hash:
+            return
+
+        launcher_ids: Optional[Set[bytes32]] = None
+        if self.singleton_watch_height is not None and peak.height > self.singleton_watch_height:
+            removed, prev_hash, last_header_hash = await get_removed_coin_names(
+                self.node_rpc_client, self.singleton_watch_height + 1, peak.height + 1
+            )
+            if prev_hash == self.singleton_watch_header_hash and last_header_hash == peak.header_hash:
+                launcher_ids = self.singleton_follower.get_stale_launcher_ids(removed)
+                # The leaving state of a singleton ends after some blocks, without any spend
+                launcher_ids.update(
+                    launcher_id
+                    for launcher_id, (_, state, is_member) in self.singleton_membership.items()
+                    if is_member and state.state == PoolSingletonState.LEAVING_POOL.value
+                )
+        if launcher_ids is None:
+            # First peak, or a reorg: the follower checks all the singletons again, and forgets reverted spends
+            launcher_ids = set(await self.store.get_launcher_ids())
+            self.log.info(f"Checking all {len(launcher_ids)} singletons at height {peak.height}")
+
+        await self.get_and_validate_singleton_states(list(launcher_ids))
+        self.singleton_watch_height = peak.height
+        self.singleton_watch_header_hash = peak.header_hash
+
+    async def partial_retention_loop(self):
+        """
+        Periodically compacts old raw partials into hourly rollups, so that the partial table and its indexes stay
+        bounded by the retention window instead of growing forever.
+        """
+        while True:
+            try:
+                cutoff = int(time.time()) - self.partial_retention_seconds
+                cutoff -= cutoff % 3600
+                compacted = await self.store.compact_partials(uint64(cutoff), self.partial_retention_batch_size)
+                if compacted > 0:
+                    self.log.info(f"Compacted {compacted} partials older than {cutoff} into hourly rollups")
+                await asyncio.sleep(self.partial_retention_interval)
+            except asyncio.CancelledError:
+                self.log.info("Cancelled partial_retention_loop, closing")
+                return
+            except Exception as e:
+                error_stack = traceback.format_exc()
+                self.log.error(f"Unexpected error in partial_retention_loop: {e} {error_stack}")
+                await asyncio.sleep(self.partial_retention_interval)
+
     async def collect_pool_rewards_loop(self):
         """
         Iterates through the blockchain, looking for pool rewards, and claims them, creating a transaction to the
@@ -241,19 +486,12 @@ class Pool:
                     await asyncio.sleep(60)
                     continue
 
-                scan_phs: List[bytes32] = list(self.scan_p2_singleton_puzzle_hashes)
                 peak_height = self.blockchain_state["peak"].height
 
-                # Only get puzzle hashes with a certain number of confirmations or more, to avoid reorg issues
-                coin_records: List[CoinRecord] = await self.node_rpc_client.get_coin_records_by_puzzle_hashes(
-                    scan_phs,
-                    include_spent_coins=False,
-                    start_height=self.scan_start_height,
-                )
-                self.log.info(
-                    f"Scanning for block rewards from {self.scan_start_height} to {peak_height}. "
-                    f"Found: {len(coin_records)}"
+                coin_records: List[CoinRecord] = await self.reward_scanner.scan(
+                    set(self.scan_p2_singleton_puzzle_hashes), peak_height
                 )
+                self.log.info(f"Scanning for block rewards up to {peak_height}. Found: {len(coin_records)}")
                 ph_to_amounts: Dict[bytes32, int] = {}
                 ph_to_coins: Dict[bytes32, List[CoinRecord]] = {}
                 not_buried_amounts = 0
@@ -272,7 +510,7 @@ class Pool:
                     set([ph for ph in ph_to_amounts.keys()])
                 )
 
-                # For each singleton, create, submit, and save a claim transaction
+                # For each singleton, create a claim transaction, they are then packed and submitted together
                 claimable_amounts = 0
                 not_claimable_amounts = 0
                 for rec in farmer_records:
@@ -286,43 +524,7 @@ class Pool:
                     self.log.info(f"Not claimable amount: {not_claimable_amounts / (10**12)}")
                     self.log.info(f"Not buried amounts: {not_buried_amounts / (10**12)}")
 
-                for rec in farmer_records:
-                    if rec.is_pool_member:
-                        singleton_tip: Optional[Coin] = get_most_recent_singleton_coin_from_coin_solution(
-                            rec.singleton_tip
-                        )
-                        if singleton_tip is None:
-                            continue
-
-                        singleton_coin_record: Optional[
-                            CoinRecord
-                        ] = await self.node_rpc_client.get_coin_record_by_name(singleton_tip.name())
-                        if singleton_coin_record is None:
-                            continue
-                        if singleton_coin_record.spent:
-                            self.log.warning(
-                                f"Singleton coin {singleton_coin_record.coin.name()} is spent, will not "
-                                f"claim rewards"
-                            )
-                            continue
-
-                        spend_bundle = await create_absorb_transaction(
-                            self.node_rpc_client,
-                            rec,
-                            self.blockchain_state["peak"].height,
-                            ph_to_coins[rec.p2_singleton_puzzle_hash],
-                            self.constants.GENESIS_CHALLENGE,
-                        )
-
-                        if spend_bundle is None:
-                            continue
-
-                        push_tx_response: Dict = await self.node_rpc_client.push_tx(spend_bundle)
-                        if push_tx_response["status"] == "SUCCESS":
-                            # TODO(pool): save transaction in records
-                            self.log.info(f"Submitted transaction successfully: {spend_bundle.name().hex()}")
-                        else:
-                            self.log.error(f"Error submitting transaction: {push_tx_response}")
+                await self.claim_rewards(farmer_records, ph_to_coins)
                 await asyncio.sleep(self.collect_pool_rewards_interval)
             except asyncio.CancelledError:
                 self.log.info("Cancelled collect_pool_rewards_loop, closing")
@@ -332,6 +534,101 @@ class Pool:
                 self.log.error(f"Unexpected error in collect_pool_rewards_loop: {e} {error_stack}")
                 await asyncio.sleep(self.collect_pool_rewards_interval)
 
+    async def claim_rewards(
+        self, farmer_records: List[FarmerRecord], ph_to_coins: Dict[bytes32, List[CoinRecord]]
+    ) -> None:
+        """
+        Creates the absorb transactions of the member farmers concurrently, at most claim_concurrency at a time and
+        each within claim_timeout, so that a slow or failing singleton does not hold back the others. The spends are
+        then packed and submitted together.
+        """
+        start_time = time.time()
+        semaphore = asyncio.Semaphore(self.claim_concurrency)
+        skipped = 0
+        failed: Set[bytes32] = set()
+
+        members: List[FarmerRecord] = [rec for rec in farmer_records if rec.is_pool_member]
+        skipped += len(farmer_records) - len(members)
+        peak_height: uint32 = self.blockchain_state["peak"].height
+
+        async def create_claim(rec: FarmerRecord) -> Optional[List[CoinSolution]]:
+            # The current state of the singleton. The follower only fetches the spends since the last peak it saw, and
+            # the absorb spends the unspent tip, so nothing needs to be buried.
+            singleton_states: Dict[
+                bytes32, Optional[Tuple[CoinSolution, PoolState]]
+            ] = await self.singleton_follower.get_singleton_states({rec.launcher_id: rec}, peak_height, 0)
+            if rec.launcher_id not in singleton_states:
+                raise RuntimeError(f"Could not look up singleton {rec.launcher_id}")
+            singleton_state: Optional[Tuple[CoinSolution, PoolState]] = singleton_states[rec.launcher_id]
+            if singleton_state is None:
+                self.log.info(f"Invalid singleton {rec.launcher_id}.")
+                return None
+
+            spend_bundle = await create_absorb_transaction(
+                self.node_rpc_client,
+                rec,
+                singleton_state,
+                ph_to_coins[rec.p2_singleton_puzzle_hash],
+                self.constants.GENESIS_CHALLENGE,
+                self.pool_parent_index,
+            )
+            return None if spend_bundle is None else spend_bundle.coin_solutions
+
+        async def create_claim_with_timeout(rec: FarmerRecord) -> Optional[List[CoinSolution]]:
+            nonlocal skipped
+            async with semaphore:
+                try:
+                    coin_solutions = await asyncio.wait_for(create_claim(rec), self.claim_timeout)
+                except asyncio.TimeoutError:
+                    self.log.error(f"Timed out creating the absorb transaction of {rec.launcher_id}")
+                    failed.add(rec.launcher_id)
+                    return None
+                except Exception as e:
+                    self.log.error(f"Error creating the absorb transaction of {rec.launcher_id}: {e}")
+                    failed.add(rec.launcher_id)
+                    return None
+            if coin_solutions is None:
+                skipped += 1
+            return coin_solutions
+
+        absorb_spends: Dict[bytes32, List[CoinSolution]] = {
+            rec.launcher_id: coin_solutions
+            for rec, coin_solutions in zip(
+                members, await asyncio.gather(*[create_claim_with_timeout(rec) for rec in members])
+            )
+            if coin_solutions is not None
+        }
+
+        bundles: List[Dict[bytes32, List[CoinSolution]]] = await plan_absorb_bundles(
+            absorb_spends, self.max_absorb_bundle_cost, self.constants.COST_PER_BYTE
+        )
+        claimed: Set[bytes32] = set()
+        for launcher_ids, spend_bundle_name, error in await submit_absorb_bundles(
+            self.node_rpc_client, bundles, self.absorb_submit_concurrency, self.claim_timeout
+        ):
+            if error is None:
+                # TODO(pool): save transaction in records
+                self.log.info(
+                    f"Submitted transaction successfully: {spend_bundle_name.hex()}, "
+                    f"absorbing rewards of {len(launcher_ids)} farmers"
+                )
+                claimed.update(launcher_ids)
+            else:
+                self.log.error(
+                    f"Error submitting transaction {spend_bundle_name.hex()} for farmers "
+                    f"{[launcher_id.hex() for launcher_id in launcher_ids]}: {error}"
+                )
+        # A farmer is failed if its spends were not accepted, alone or with others
+        failed.update(launcher_id for launcher_id in absorb_spends.keys() if launcher_id not in claimed)
+
+        self.claim_stats = {
+            "claimed": len(claimed),
+            "skipped": skipped,
+            "failed": len(failed),
+            "duration": time.time() - start_time,
+        }
+        self.log.info(f"Claim cycle: {self.claim_stats}")
+
     async def create_payment_loop(self):
         """
         Calculates the points of each farmer, and splits the total funds received into coins for each farmer.
@@ -368,20 +665,22 @@ class Pool:
                 self.log.info(f"Pool coin amount (includes blockchain fee) {pool_coin_amount  / (10 ** 12)}")
                 self.log.info(f"Total amount to distribute: {amount_to_distribute  / (10 ** 12)}")
 
-                async with self.store.lock:
-                    # Get the points of each farmer, as well as payout instructions. Here a chia address is used,
-                    # but other blockchain addresses can also be used.
-                    points_and_ph: List[
-                        Tuple[uint64, bytes]
-                    ] = await self.store.get_farmer_points_and_payout_instructions()
-                    total_points = sum([pt for (pt, ph) in points_and_ph])
-                    if total_points > 0:
-                        mojo_per_point = floor(amount_to_distribute / total_points)
-                        self.log.info(f"Paying out {mojo_per_point} mojo / point")
-
-                        additions_sub_list: List[Dict] = [
-                            {"puzzle_hash": self.pool_fee_puzzle_hash, "amount": pool_coin_amount}
-                        ]
+                # Closes the points epoch, partials keep accumulating points in the next one while this one is paid
+                # out. Points are summed per payout instructions. Here a chia address is used, but other blockchain
+                # addresses can also be used.
+                epoch = await self.store.close_points_epoch()
+                total_points = await self.store.get_points_epoch_total(epoch)
+
+                if total_points > 0:
+                    mojo_per_point = floor(amount_to_distribute / total_points)
+                    self.log.info(f"Paying out {mojo_per_point} mojo / point")
+
+                    additions_sub_list: List[Dict] = [
+                        {"puzzle_hash": self.pool_fee_puzzle_hash, "amount": pool_coin_amount}
+                    ]
+                    async for points_and_ph in self.store.get_points_epoch_payouts(
+                        epoch, self.max_additions_per_transaction
+                    ):
                         for points, ph in points_and_ph:
                             additions_sub_list.append({"puzzle_hash": ph, "amount": points * mojo_per_point})
 
@@ -390,14 +689,13 @@ class Pool:
                                 self.log.info(f"Will make payments: {additions_sub_list}")
                                 additions_sub_list = []
 
-                        if len(additions_sub_list) > 0:
-                            self.log.info(f"Will make payments: {additions_sub_list}")
-                            await self.pending_payments.put(additions_sub_list.copy())
+                    if len(additions_sub_list) > 0:
+                        self.log.info(f"Will make payments: {additions_sub_list}")
+                        await self.pending_payments.put(additions_sub_list.copy())
 
-                        # Subtract the points from each farmer
-                        await self.store.clear_farmer_points()
-                    else:
-                        self.log.info(f"No points for any farmer. Waiting {self.payment_interval}")
+                else:
+                    self.log.info(f"No points for any farmer. Waiting {self.payment_interval}")
+                await self.store.mark_points_epoch_paid(epoch)
 
                 await asyncio.sleep(self.payment_interval)
             except asyncio.CancelledError:
@@ -467,80 +765,165 @@ class Pool:
 
     async def confirm_partials_loop(self):
         """
-        Pulls things from the queue of partials one at a time, and adjusts balances.
+        Takes all the partials whose confirmation delay is over, in batches, and adjusts balances. Each batch is
+        confirmed in its own task, so a slow batch does not hold back the batches that are due after it.
         """
 
         while True:
             try:
                 # The points are based on the difficulty at the time of partial submission, not at the time of
                 # confirmation
-                partial, time_received, points_received = await self.pending_point_partials.get()
-
-                # Wait a few minutes to check if partial is still valid in the blockchain (no reorgs)
-                await asyncio.sleep((max(0, time_received + self.partial_confirmation_delay - time.time() - 5)))
-
-                # Starts a task to check the remaining things for this partial and optionally update points
-                asyncio.create_task(self.check_and_confirm_partial(partial, points_received))
+                partials: List[
+                    Tuple[PostPartialRequest, uint64, int]
+                ] = await self.partial_confirmation_scheduler.next_batch()
+                task = asyncio.create_task(self.confirm_partial_batch(partials))
+                self.confirm_partial_batch_tasks.add(task)
+                task.add_done_callback(self.confirm_partial_batch_tasks.discard)
             except asyncio.CancelledError:
                 self.log.info("Cancelled confirm partials loop, closing")
                 return
             except Exception as e:
-                self.log.error(f"Unexpected error: {e}")
+                error_stack = traceback.format_exc()
+                self.log.error(f"Unexpected error in confirm_partials_loop: {e} {error_stack}")
 
-    async def check_and_confirm_partial(self, partial: PostPartialRequest, points_received: uint64) -> None:
+    async def confirm_partial_batch(self, partials: List[Tuple[PostPartialRequest, uint64, int]]) -> None:
         try:
-            # TODO(pool): these lookups to the full node are not efficient and can be cached, especially for
-            #  scaling to many users
-            if partial.payload.end_of_sub_slot:
-                response = await self.node_rpc_client.get_recent_signage_point_or_eos(None, partial.payload.sp_hash)
-                if response is None or response["reverted"]:
-                    self.log.info(f"Partial EOS reverted: {partial.payload.sp_hash}")
-                    return
+            retry_launcher_ids: Set[bytes32] = await self.confirm_partials(
+                [(partial, points) for partial, points, _ in partials]
+            )
+        except Exception as e:
+            # The partials stay in the journal, they are replayed on the next start
+            error_stack = traceback.format_exc()
+            self.log.error(f"Unexpected error confirming {len(partials)} partials: {e} {error_stack}")
+            return
+        while True:
+            try:
+                await self.store.flush_partials()
+                break
+            except Exception as e:
+                # A failed flush keeps the points buffered, they are written by a later flush
+                self.log.error(f"Error flushing confirmed partials, retrying: {e}")
+                await asyncio.sleep(self.partial_flush_interval)
+        # Only once the points are in the database does the journal forget the partials. The confirmations are
+        # synced right away: replaying partials whose points were already committed would count them twice, since the
+        # recent proofs are not persisted.
+        retry_time = time.time() + self.partial_confirmation_retry_delay
+        for partial, points, seq in partials:
+            if partial.payload.launcher_id in retry_launcher_ids:
+                # Still in the journal, in case the pool stops before the retry
+                self.partial_confirmation_scheduler.add(retry_time, (partial, points, seq))
             else:
-                response = await self.node_rpc_client.get_recent_signage_point_or_eos(partial.payload.sp_hash, None)
-                if response is None or response["reverted"]:
-                    self.log.info(f"Partial SP reverted: {partial.payload.sp_hash}")
-                    return
-
-            # Now we know that the partial came on time, but also that the signage point / EOS is still in the
-            # blockchain. We need to check for double submissions.
-            pos_hash = partial.payload.proof_of_space.get_hash()
-            if self.recent_points_added.get(pos_hash):
-                self.log.info(f"Double signage point submitted for proof: {partial.payload}")
-                return
-            self.recent_points_added.put(pos_hash, uint64(1))
+                self.partial_journal.confirm(seq)
+        try:
+            await self.partial_journal.sync()
+        except Exception as e:
+            self.log.error(f"Error syncing the partial journal: {e}")
 
-            # Now we need to check to see that the singleton in the blockchain is still assigned to this pool
-            singleton_state_tuple: Optional[
-                Tuple[CoinSolution, PoolState, bool]
-            ] = await self.get_and_validate_singleton_state(partial.payload.launcher_id)
+    async def confirm_partials(self, partials: List[Tuple[PostPartialRequest, uint64]]) -> Set[bytes32]:
+        """
+        Checks that the signage points of the partials were not reverted, and that their singletons are still
+        assigned to this pool, and adds the points of the valid ones. Each signage point and each singleton is
+        checked once for the whole batch.
+        :return: the launcher ids of the singletons that could not be looked up, their partials must be confirmed
+        again later
+        """
+        semaphore = asyncio.Semaphore(self.partial_confirmation_concurrency)
 
-            if singleton_state_tuple is None:
-                self.log.info(f"Invalid singleton {partial.payload.launcher_id}")
-                return
+        async def check_signage_point(sp_hash: bytes32, is_eos: bool) -> bool:
+            async with semaphore:
+                try:
+                    response = await self.signage_point_cache.get(sp_hash, is_eos)
+                except Exception as e:
+                    self.log.error(f"Error looking up signage point or EOS {sp_hash}: {e}")
+                    return False
+            if response is None or response["reverted"]:
+                if is_eos:
+                    self.log.info(f"Partial EOS reverted: {sp_hash}")
+                else:
+                    self.log.info(f"Partial SP reverted: {sp_hash}")
+                return False
+            return True
+
+        signage_points: List[Tuple[bytes32, bool]] = list(
+            {(partial.payload.sp_hash, partial.payload.end_of_sub_slot) for partial, _ in partials}
+        )
+        valid_signage_points: Set[Tuple[bytes32, bool]] = {
+            signage_point
+            for signage_point, valid in zip(
+                signage_points, await asyncio.gather(*[check_signage_point(*sp) for sp in signage_points])
+            )
+            if valid
+        }
+
+        # Now we know that the partials came on time, but also that the signage point / EOS is still in the
+        # blockchain. Double submissions were already rejected by process_partial.
+        partials_by_launcher: Dict[bytes32, List[Tuple[PostPartialRequest, uint64]]] = {}
+        for partial, points_received in partials:
+            if (partial.payload.sp_hash, partial.payload.end_of_sub_slot) not in valid_signage_points:
+                continue
+            partials_by_launcher.setdefault(partial.payload.launcher_id, []).append((partial, points_received))
+
+        # Now we need to check to see that the singletons in the blockchain are still assigned to this pool. The
+        # singletons are kept up to date by singleton_watch_loop, only the ones it did not see yet are looked up.
+        singleton_states: Dict[bytes32, Optional[Tuple[CoinSolution, PoolState, bool]]] = {}
+        unknown_launcher_ids: List[bytes32] = []
+        for launcher_id in partials_by_launcher.keys():
+            if launcher_id in self.singleton_membership:
+                singleton_states[launcher_id] = self.singleton_membership[launcher_id]
+            else:
+                unknown_launcher_ids.append(launcher_id)
+        singleton_states.update(await self.get_and_validate_singleton_states(unknown_launcher_ids))
+        retry_launcher_ids: Set[bytes32] = {
+            launcher_id for launcher_id in unknown_launcher_ids if launcher_id not in singleton_states
+        }
+        if len(retry_launcher_ids) > 0:
+            self.log.warning(f"Could not look up {len(retry_launcher_ids)} singletons, confirming their partials later")
+
+        async def confirm_farmer_partials(
+            launcher_id: bytes32, farmer_partials: List[Tuple[PostPartialRequest, uint64]]
+        ):
+            try:
+                singleton_state_tuple = singleton_states[launcher_id]
+                if singleton_state_tuple is None:
+                    self.log.info(f"Invalid singleton {launcher_id}")
+                    return
 
-            _, _, is_member = singleton_state_tuple
-            if not is_member:
-                self.log.info(f"Singleton is not assigned to this pool")
-                return
+                _, _, is_member = singleton_state_tuple
+                if not is_member:
+                    self.log.info(f"Singleton is not assigned to this pool")
+                    return
 
-            async with self.store.lock:
-                farmer_record: Optional[FarmerRecord] = await self.store.get_farmer_record(partial.payload.launcher_id)
+                async with self.farmer_locks(launcher_id):
+                    farmer_record: Optional[FarmerRecord] = await self.store.get_farmer_record(launcher_id)
 
-                assert (
-                    partial.payload.proof_of_space.pool_contract_puzzle_hash == farmer_record.p2_singleton_puzzle_hash
-                )
+                    for partial, points_received in farmer_partials:
+                        assert (
+                            partial.payload.proof_of_space.pool_contract_puzzle_hash
+                            == farmer_record.p2_singleton_puzzle_hash
+                        )
 
-                if farmer_record.is_pool_member:
-                    await self.store.add_partial(partial.payload.launcher_id, uint64(int(time.time())), points_received)
+                        if farmer_record.is_pool_member:
+                            await self.store.add_partial(launcher_id, uint64(int(time.time())), points_received)
 
-                self.log.info(f"Farmer {farmer_record.launcher_id} updated points to: " f"{farmer_record.points}")
-        except Exception as e:
-            error_stack = traceback.format_exc()
-            self.log.error(f"Exception in confirming partial: {e} {error_stack}")
+                    self.log.info(
+                        f"Farmer {launcher_id} confirmed {len(farmer_partials)} partials, points: "
+                        f"{farmer_record.points + sum(points for _, points in farmer_partials)}"
+                    )
+            except Exception as e:
+                error_stack = traceback.format_exc()
+                self.log.error(f"Exception in confirming partials of {launcher_id}: {e} {error_stack}")
+
+        await asyncio.gather(
+            *[
+                confirm_farmer_partials(launcher_id, farmer_partials)
+                for launcher_id, farmer_partials in partials_by_launcher.items()
+                if launcher_id not in retry_launcher_ids
+            ]
+        )
+        return retry_launcher_ids
 
     async def add_farmer(self, request: PostFarmerRequest) -> Dict:
-        async with self.store.lock:
+        async with self.farmer_locks(request.payload.launcher_id):
             farmer_record: Optional[FarmerRecord] = await self.store.get_farmer_record(request.payload.launcher_id)
             if farmer_record is not None:
                 return error_dict(
@@ -663,7 +1046,8 @@ class Pool:
 
         async def update_farmer_later():
             await asyncio.sleep(self.farmer_update_cooldown_seconds)
-            await self.store.add_farmer_record(FarmerRecord.from_json_dict(farmer_dict))
+            async with self.farmer_locks(launcher_id):
+                await self.store.add_farmer_record(FarmerRecord.from_json_dict(farmer_dict))
             self.farmer_update_blocked.remove(launcher_id)
             self.log.info(f"Updated farmer: {response_dict}")
 
@@ -680,31 +1064,72 @@ class Pool:
         our pool, with the correct parameters. Otherwise, None. Note that this state must be buried (recent state
         changes are not returned)
         """
-        singleton_task: Optional[Task] = self.follow_singleton_tasks.get(launcher_id, None)
-        remove_after = False
-        farmer_rec = None
-        if singleton_task is None or singleton_task.done():
-            farmer_rec: Optional[FarmerRecord] = await self.store.get_farmer_record(launcher_id)
-            singleton_task = asyncio.create_task(
-                get_singleton_state(
-                    self.node_rpc_client,
-                    launcher_id,
-                    farmer_rec,
-                    self.blockchain_state["peak"].height,
-                    self.confirmation_security_threshold,
-                )
-            )
-            self.follow_singleton_tasks[launcher_id] = singleton_task
-            remove_after = True
-
-        optional_result: Optional[Tuple[CoinSolution, PoolState]] = await singleton_task
-        if remove_after and launcher_id in self.follow_singleton_tasks:
-            await self.follow_singleton_tasks.pop(launcher_id)
+        return (await self.get_and_validate_singleton_states([launcher_id])).get(launcher_id)
 
-        if optional_result is None:
-            return None
+    async def get_and_validate_singleton_states(
+        self, launcher_ids: List[bytes32]
+    ) -> Dict[bytes32, Optional[Tuple[CoinSolution, PoolState, bool]]]:
+        """
+        Same as get_and_validate_singleton_state for many singletons, which are followed together by the singleton
+        follower. The farmers whose singleton changed are updated in the database in one batch, and the results are
+        kept in singleton_membership. The singletons that could not be looked up, because of an error of the full
+        node, are left out of the results and keep their previous membership.
+        """
+        if len(launcher_ids) == 0:
+            return {}
+        farmer_records: Dict[bytes32, Optional[FarmerRecord]] = {
+            launcher_id: await self.store.get_farmer_record(launcher_id) for launcher_id in launcher_ids
+        }
+        singleton_states: Dict[
+            bytes32, Optional[Tuple[CoinSolution, PoolState]]
+        ] = await self.singleton_follower.get_singleton_states(farmer_records, self.blockchain_state["peak"].height)
+
+        async def validate(launcher_id: bytes32) -> Optional[Tuple[CoinSolution, PoolState, bool]]:
+            optional_result = singleton_states[launcher_id]
+            if optional_result is None:
+                return None
+            try:
+                return await self.validate_singleton_state(launcher_id, *optional_result)
+            except Exception as e:
+                self.log.error(f"Error validating singleton {launcher_id}: {e}")
+                return None
+
+        found_launcher_ids: List[bytes32] = [
+            launcher_id for launcher_id in launcher_ids if launcher_id in singleton_states
+        ]
+        results: Dict[bytes32, Optional[Tuple[CoinSolution, PoolState, bool]]] = dict(
+            zip(
+                found_launcher_ids, await asyncio.gather(*[validate(launcher_id) for launcher_id in found_launcher_ids])
+            )
+        )
 
-        singleton_tip, singleton_tip_state = optional_result
+        updates: List[Tuple[bytes32, CoinSolution, PoolState, bool]] = []
+        for launcher_id, result in results.items():
+            if result is None:
+                self.singleton_membership.pop(launcher_id, None)
+                continue
+            self.singleton_membership[launcher_id] = result
+            farmer_rec: Optional[FarmerRecord] = farmer_records[launcher_id]
+            singleton_tip, singleton_tip_state, is_pool_member = result
+            if farmer_rec is not None and (
+                farmer_rec.singleton_tip != singleton_tip
+                or farmer_rec.singleton_tip_state != singleton_tip_state
+                or farmer_rec.is_pool_member != is_pool_member
+            ):
+                # This means the singleton has been changed in the blockchain (either by us or someone else). We
+                # still keep track of this singleton if the farmer has changed to a different pool, in case they
+                # switch back.
+                self.log.info(f"Updating singleton state for {launcher_id}")
+                updates.append((launcher_id, singleton_tip, singleton_tip_state, is_pool_member))
+        await self.store.update_singletons(updates)
+        return results
+
+    async def validate_singleton_state(
+        self,
+        launcher_id: bytes32,
+        singleton_tip: CoinSolution,
+        singleton_tip_state: PoolState,
+    ) -> Tuple[CoinSolution, PoolState, bool]:
 
         # Validate state of the singleton
         is_pool_member = True
@@ -727,122 +1152,182 @@ class Pool:
                 is_pool_member = False
 
         self.log.info(f"Is {launcher_id} pool member: {is_pool_member}")
+        return singleton_tip, singleton_tip_state, is_pool_member
 
-        if farmer_rec is not None and (
-            farmer_rec.singleton_tip != singleton_tip or farmer_rec.singleton_tip_state != singleton_tip_state
-        ):
-            # This means the singleton has been changed in the blockchain (either by us or someone else). We
-            # still keep track of this singleton if the farmer has changed to a different pool, in case they
-            # switch back.
-            self.log.info(f"Updating singleton state for {launcher_id}")
-            await self.store.update_singleton(launcher_id, singleton_tip, singleton_tip_state, is_pool_member)
+    def count_partial_result(self, result: str) -> None:
+        self.partial_results[result] = self.partial_results.get(result, 0) + 1
 
-        return singleton_tip, singleton_tip_state, is_pool_member
+    def reject_partial(self, code: PoolErrorCode, message: str, result: Optional[str] = None) -> Dict:
+        """
+        :param result: the name the rejection is counted under, the name of code by default
+        """
+        self.count_partial_result(code.name if result is None else result)
+        return error_dict(code, message)
 
     async def process_partial(
         self,
         partial: PostPartialRequest,
-        farmer_record: FarmerRecord,
+        farmer_record: FarmerHotState,
         time_received_partial: uint64,
     ) -> Dict:
-        # Validate signatures
+        """
+        Validates a partial of a known farmer with a valid authentication token, and adds it for confirmation. The
+        checks run cheapest first, so that invalid or spam partials are dropped before the expensive ones.
+        """
+        # Stage 1: the plot must be assigned to the farmer's singleton
+        if partial.payload.proof_of_space.pool_contract_puzzle_hash != farmer_record.p2_singleton_puzzle_hash:
+            return self.reject_partial(
+                PoolErrorCode.INVALID_P2_SINGLETON_PUZZLE_HASH,
+                f"Invalid plot pool contract puzzle hash {partial.payload.proof_of_space.pool_contract_puzzle_hash}",
+            )
+
+        # Stage 2: double submissions. The proof itself is only reserved once the signature is valid, below.
+        pos_hash = partial.payload.proof_of_space.get_hash()
+        if self.recent_proofs.contains(pos_hash, time_received_partial):
+            return self.reject_partial(
+                PoolErrorCode.REQUEST_FAILED, f"Double submission of proof {pos_hash}", "DOUBLE_SUBMISSION"
+            )
+
+        # Stage 3: the signage point or EOS must be known, and the partial on time. This is usually a cache hit. A miss
+        # is only looked up (or waited for) once the signature is valid, so unsigned partials for made up signage
+        # points never reach the full node.
+        sp_response: Optional[Dict] = self.signage_point_cache.get_cached(
+            partial.payload.sp_hash, partial.payload.end_of_sub_slot
+        )
+        if sp_response is not None:
+            error = self.check_signage_point(partial, sp_response, time_received_partial)
+            if error is not None:
+                return error
+
+        # Stage 4: validate signatures
         message: bytes32 = partial.payload.get_hash()
         pk1: G1Element = partial.payload.proof_of_space.plot_public_key
         pk2: G1Element = farmer_record.authentication_public_key
-        valid_sig = AugSchemeMPL.aggregate_verify([pk1, pk2], [message, message], partial.aggregate_signature)
+        valid_sig = await self.signature_verifier.verify([pk1, pk2], [message, message], partial.aggregate_signature)
         if not valid_sig:
-            return error_dict(
+            return self.reject_partial(
                 PoolErrorCode.INVALID_SIGNATURE,
                 f"The aggregate signature is invalid {partial.aggregate_signature}",
             )
 
-        # TODO (chia-dev): Check DB p2_singleton_puzzle_hash and compare
-        # if partial.payload.proof_of_space.pool_contract_puzzle_hash != p2_singleton_puzzle_hash:
-        #     return error_dict(
-        #       PoolErrorCode.INVALID_P2_SINGLETON_PUZZLE_HASH,
-        #       f"Invalid plot pool contract puzzle hash {partial.payload.proof_of_space.pool_contract_puzzle_hash}"
-        #     )
-
-        async def get_signage_point_or_eos():
-            if partial.payload.end_of_sub_slot:
-                return await self.node_rpc_client.get_recent_signage_point_or_eos(None, partial.payload.sp_hash)
-            else:
-                return await self.node_rpc_client.get_recent_signage_point_or_eos(partial.payload.sp_hash, None)
-
-        response = await get_signage_point_or_eos()
-        if response is None:
-            # Try again after 10 seconds in case we just didn't yet receive the signage point
-            await asyncio.sleep(10)
-            response = await get_signage_point_or_eos()
+        # Reserves the proof, so that concurrent copies of the same partial are rejected. Only a signed partial can,
+        # otherwise a copy with a bad signature could get the real partial rejected as a double submission.
+        if not self.recent_proofs.add(pos_hash, time_received_partial):
+            return self.reject_partial(
+                PoolErrorCode.REQUEST_FAILED, f"Double submission of proof {pos_hash}", "DOUBLE_SUBMISSION"
+            )
+        try:
+            response: Optional[Dict] = None
+            if sp_response is None:
+                # In case we just didn't yet receive the signage point, waits for it as long as the partial can still
+                # be on time
+                sp_response = await self.signage_point_cache.wait(
+                    partial.payload.sp_hash,
+                    partial.payload.end_of_sub_slot,
+                    self.partial_time_limit - (time.time() - time_received_partial),
+                )
+                response = self.check_signage_point(partial, sp_response, time_received_partial)
+            if response is None:
+                response = await self.validate_and_add_partial(
+                    partial, farmer_record, time_received_partial, sp_response
+                )
+        except Exception:
+            # validate_and_add_partial does not raise once the partial is scheduled, so it was not accepted
+            self.recent_proofs.discard(pos_hash)
+            raise
+        if "error_code" in response:
+            # The partial was not accepted, the farmer may submit it again
+            self.recent_proofs.discard(pos_hash)
+        else:
+            self.count_partial_result("ACCEPTED")
+        return response
 
+    def check_signage_point(
+        self, partial: PostPartialRequest, response: Optional[Dict], time_received_partial: uint64
+    ) -> Optional[Dict]:
+        """
+        :return: the error to reply with if the signage point or EOS of the partial is unknown or reverted, or the
+        partial came too late for it, else None
+        """
         if response is None or response["reverted"]:
-            return error_dict(
+            return self.reject_partial(
                 PoolErrorCode.NOT_FOUND, f"Did not find signage point or EOS {partial.payload.sp_hash}, {response}"
             )
         node_time_received_sp = response["time_received"]
-
-        signage_point: Optional[SignagePoint] = response.get("signage_point", None)
-        end_of_sub_slot: Optional[EndOfSubSlotBundle] = response.get("eos", None)
-
         if time_received_partial - node_time_received_sp > self.partial_time_limit:
-            return error_dict(
+            return self.reject_partial(
                 PoolErrorCode.TOO_LATE,
                 f"Received partial in {time_received_partial - node_time_received_sp}. "
                 f"Make sure your proof of space lookups are fast, and network connectivity is good."
                 f"Response must happen in less than {self.partial_time_limit} seconds. NAS or network"
                 f" farming can be an issue",
             )
+        return None
+
+    async def validate_and_add_partial(
+        self,
+        partial: PostPartialRequest,
+        farmer_record: FarmerHotState,
+        time_received_partial: uint64,
+        signage_point_response: Dict,
+    ) -> Dict:
+        signage_point: Optional[SignagePoint] = signage_point_response.get("signage_point", None)
+        end_of_sub_slot: Optional[EndOfSubSlotBundle] = signage_point_response.get("eos", None)
 
-        # Validate the proof
+        # Stage 5: validate the proof
         if signage_point is not None:
             challenge_hash: bytes32 = signage_point.cc_vdf.challenge
         else:
             challenge_hash = end_of_sub_slot.challenge_chain.challenge_chain_end_of_slot_vdf.get_hash()
 
-        quality_string: Optional[bytes32] = partial.payload.proof_of_space.verify_and_get_quality_string(
-            self.constants, challenge_hash, partial.payload.sp_hash
-        )
-        if quality_string is None:
-            return error_dict(PoolErrorCode.INVALID_PROOF, f"Invalid proof of space {partial.payload.sp_hash}")
-
         current_difficulty = farmer_record.difficulty
-        required_iters: uint64 = calculate_iterations_quality(
-            self.constants.DIFFICULTY_CONSTANT_FACTOR,
-            quality_string,
-            partial.payload.proof_of_space.size,
-            current_difficulty,
-            partial.payload.sp_hash,
+        verified: Optional[Tuple[bytes32, uint64]] = await self.proof_verifier.verify(
+            partial.payload.proof_of_space, challenge_hash, partial.payload.sp_hash, current_difficulty
         )
+        if verified is None:
+            return self.reject_partial(PoolErrorCode.INVALID_PROOF, f"Invalid proof of space {partial.payload.sp_hash}")
+        _, required_iters = verified
 
         if required_iters >= self.iters_limit:
-            return error_dict(
+            return self.reject_partial(
                 PoolErrorCode.PROOF_NOT_GOOD_ENOUGH,
                 f"Proof of space has required iters {required_iters}, too high for difficulty " f"{current_difficulty}",
             )
 
-        await self.pending_point_partials.put((partial, time_received_partial, current_difficulty))
+        # Checks the partial a little before the delay is over, to account for the time the confirmation takes
+        due_time = time_received_partial + self.partial_confirmation_delay - 5
+        seq = self.partial_journal.append(struct.pack(">Qd", current_difficulty, due_time) + bytes(partial))
+        self.partial_confirmation_scheduler.add(due_time, (partial, current_difficulty, seq))
 
-        async with self.store.lock:
-            # Obtains the new record in case we just updated difficulty
-            farmer_record: Optional[FarmerRecord] = await self.store.get_farmer_record(partial.payload.launcher_id)
-            if farmer_record is not None:
-                current_difficulty = farmer_record.difficulty
-                # Decide whether to update the difficulty
-                recent_partials = await self.store.get_recent_partials(
-                    partial.payload.launcher_id, self.number_of_partials_target
-                )
-                # Only update the difficulty if we meet certain conditions
-                new_difficulty: uint64 = get_new_difficulty(
-                    recent_partials,
-                    int(self.number_of_partials_target),
-                    int(self.time_target),
-                    current_difficulty,
-                    time_received_partial,
-                    self.min_difficulty,
+        # The partial is accepted from here on, so it keeps its proof reserved. Failing the request would let the farmer
+        # submit it again and get it counted twice, a failed difficulty update is only logged.
+        try:
+            async with self.farmer_locks(partial.payload.launcher_id):
+                # Obtains the new record in case we just updated difficulty
+                farmer_record: Optional[FarmerHotState] = await self.store.get_farmer_hot_state(
+                    partial.payload.launcher_id
                 )
+                if farmer_record is not None:
+                    current_difficulty = farmer_record.difficulty
+                    # Decide whether to update the difficulty
+                    recent_partials = await self.store.get_recent_partials(
+                        partial.payload.launcher_id, self.number_of_partials_target
+                    )
+                    # Only update the difficulty if we meet certain conditions
+                    new_difficulty: uint64 = get_new_difficulty(
+                        recent_partials,
+                        int(self.number_of_partials_target),
+                        int(self.time_target),
+                        current_difficulty,
+                        time_received_partial,
+                        self.min_difficulty,
+                    )
 
-                if current_difficulty != new_difficulty:
-                    await self.store.update_difficulty(partial.payload.launcher_id, new_difficulty)
-                    current_difficulty = new_difficulty
+                    if current_difficulty != new_difficulty:
+                        await self.store.update_difficulty(partial.payload.launcher_id, new_difficulty)
+                        current_difficulty = new_difficulty
+        except Exception as e:
+            error_stack = traceback.format_exc()
+            self.log.error(f"Error updating the difficulty of {partial.payload.launcher_id}: {e} {error_stack}")
 
         return PostPartialResponse(current_difficulty).to_json_dict()
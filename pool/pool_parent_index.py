@@ -0,0 +1,47 @@
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from chia.consensus.coinbase import pool_parent_id
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.util.ints import uint32
+
+
+class PoolParentIndex:
+    """
+    The height of each of the last window blocks, by the parent coin id of their pool reward. A pool reward coin is
+    only claimable with the height it was farmed at, which is otherwise found by hashing candidate heights until
+    one matches its parent id. The index is extended on each new peak, so only the new heights are hashed, and
+    looking up a reward is a dict lookup.
+    """
+
+    def __init__(self, genesis_challenge: bytes32, window: int = 4608):
+        self.genesis_challenge = genesis_challenge
+        self.window = window
+        self.heights: Dict[bytes32, uint32] = {}
+        # Parent ids of the indexed heights, lowest first, to drop them from heights when they leave the window
+        self.parent_ids: Deque[bytes32] = deque()
+        # The indexed heights are [start_height, end_height)
+        self.start_height = 0
+        self.end_height = 0
+
+    def update(self, peak_height: uint32) -> None:
+        start_height = max(0, peak_height + 1 - self.window)
+        if start_height >= self.end_height:
+            self.heights.clear()
+            self.parent_ids.clear()
+            self.start_height = self.end_height = start_height
+        while self.start_height < start_height:
+            del self.heights[self.parent_ids.popleft()]
+            self.start_height += 1
+        # After a reorg to a lower peak, the higher heights are kept, the pool parent id only depends on the height
+        for height in range(self.end_height, peak_height + 1):
+            parent_id: bytes32 = pool_parent_id(uint32(height), self.genesis_challenge)
+            self.heights[parent_id] = uint32(height)
+            self.parent_ids.append(parent_id)
+        self.end_height = max(self.end_height, peak_height + 1)
+
+    def get_height(self, parent_coin_info: bytes32) -> Optional[uint32]:
+        return self.heights.get(parent_coin_info)
+
+    def __len__(self) -> int:
+        return len(self.heights)
@@ -28,7 +28,7 @@ from chia.util.ints import uint8, uint64, uint32
 from chia.util.default_root import DEFAULT_ROOT_PATH
 from chia.util.config import load_config
 
-from store import FarmerRecord
+from store import FarmerRecord, FarmerHotState
 from pool import Pool
 from util import error_response
 
@@ -177,8 +177,13 @@ class PoolServer:
     async def post_partial(self, request_obj) -> web.Response:
         # TODO(pool): add rate limiting
         start_time = time.time()
-        request = await request_obj.json()
-        partial: PostPartialRequest = PostPartialRequest.from_json_dict(request)
+        try:
+            request = await request_obj.json()
+            partial: PostPartialRequest = PostPartialRequest.from_json_dict(request)
+        except Exception:
+            # The error response is sent by wrap_http_handler
+            self.pool.count_partial_result("INVALID_REQUEST")
+            raise
 
         authentication_token_error = check_authentication_token(
             partial.payload.launcher_id,
@@ -186,16 +191,24 @@ class PoolServer:
             self.pool.authentication_token_timeout,
         )
         if authentication_token_error is not None:
+            self.pool.count_partial_result(PoolErrorCode.INVALID_AUTHENTICATION_TOKEN.name)
             return authentication_token_error
 
-        farmer_record: Optional[FarmerRecord] = await self.pool.store.get_farmer_record(partial.payload.launcher_id)
-        if farmer_record is None:
-            return error_response(
-                PoolErrorCode.FARMER_NOT_KNOWN,
-                f"Farmer with launcher_id {partial.payload.launcher_id.hex()} not known.",
+        try:
+            farmer_record: Optional[FarmerHotState] = await self.pool.store.get_farmer_hot_state(
+                partial.payload.launcher_id
             )
-
-        post_partial_response = await self.pool.process_partial(partial, farmer_record, start_time)
+            if farmer_record is None:
+                self.pool.count_partial_result(PoolErrorCode.FARMER_NOT_KNOWN.name)
+                return error_response(
+                    PoolErrorCode.FARMER_NOT_KNOWN,
+                    f"Farmer with launcher_id {partial.payload.launcher_id.hex()} not known.",
+                )
+
+            post_partial_response = await self.pool.process_partial(partial, farmer_record, start_time)
+        except Exception:
+            self.pool.count_partial_result(PoolErrorCode.SERVER_EXCEPTION.name)
+            raise
 
         self.pool.log.info(
             f"post_partial response {post_partial_response}, time: {time.time() - start_time} "
@@ -238,6 +251,10 @@ class PoolServer:
             response["farmer_record"] = record
             recent_partials = await self.pool.store.get_recent_partials(launcher_id, 20)
             response["recent_partials"] = recent_partials
+            # Hourly partial counts for the last 30 days, older hours are served from the compacted rollups
+            response["hourly_partials"] = await self.pool.store.get_hourly_partials(
+                launcher_id, uint64(int(time.time()) - 30 * 24 * 3600)
+            )
 
         # TODO(pool) Do what ever you like with the successful login
         return obj_to_response(response)
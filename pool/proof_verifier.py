@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+from chia.consensus.constants import ConsensusConstants
+from chia.consensus.pot_iterations import calculate_iterations_quality
+from chia.types.blockchain_format.proof_of_space import ProofOfSpace
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.util.ints import uint64
+
+# Set in each worker process by _init_worker
+_worker_constants: Optional[ConsensusConstants] = None
+
+
+def verify_proof(
+    constants: ConsensusConstants,
+    proof_of_space: ProofOfSpace,
+    challenge_hash: bytes32,
+    sp_hash: bytes32,
+    difficulty: uint64,
+) -> Optional[Tuple[bytes32, uint64]]:
+    """
+    :return: the quality string and the required iterations of the proof, or None if the proof is invalid
+    """
+    quality_string: Optional[bytes32] = proof_of_space.verify_and_get_quality_string(constants, challenge_hash, sp_hash)
+    if quality_string is None:
+        return None
+    required_iters: uint64 = calculate_iterations_quality(
+        constants.DIFFICULTY_CONSTANT_FACTOR,
+        quality_string,
+        proof_of_space.size,
+        difficulty,
+        sp_hash,
+    )
+    return quality_string, required_iters
+
+
+def _init_worker(constants: ConsensusConstants) -> None:
+    global _worker_constants
+    _worker_constants = constants
+
+
+def _warm_up() -> int:
+    # Workers are only started when no idle one is left, so each warm-up task keeps its worker busy until all the
+    # warm-up tasks are submitted
+    time.sleep(0.1)
+    return os.getpid()
+
+
+def _verify_proof_in_worker(
+    proof_of_space: bytes, challenge_hash: bytes32, sp_hash: bytes32, difficulty: uint64
+) -> Tuple[Optional[Tuple[bytes32, uint64]], float, float]:
+    # The proof is passed serialized, since the BLS keys in it do not pickle
+    start = time.time()
+    result = verify_proof(
+        _worker_constants, ProofOfSpace.from_bytes(proof_of_space), challenge_hash, sp_hash, difficulty
+    )
+    return result, start, time.time()
+
+
+class ProofVerifier:
+    """
+    Verifies proofs of space and computes their required iterations in a pool of worker processes, so that the CPU
+    heavy verification of a burst of partials neither blocks the event loop nor is limited to one core. With 0
+    workers, proofs are verified inline on the event loop.
+    """
+
+    def __init__(self, constants: ConsensusConstants, workers: int):
+        self.constants = constants
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.tasks = 0
+        self.queue_seconds = 0.0
+        self.run_seconds = 0.0
+        self.max_total_seconds = 0.0
+        self.restarts = 0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked, the pool has database and RPC threads running by then
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.constants,),
+        )
+
+    async def start(self) -> None:
+        if self.workers <= 0:
+            return
+        self.executor = self._create_executor()
+        # Starts all worker processes now, instead of during the first burst of partials
+        loop = asyncio.get_event_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(self.executor, _warm_up) for _ in range(self.workers)])
+        logging.info(f"Started {len(set(pids))} proof verification workers")
+
+    def stop(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def verify(
+        self, proof_of_space: ProofOfSpace, challenge_hash: bytes32, sp_hash: bytes32, difficulty: uint64
+    ) -> Optional[Tuple[bytes32, uint64]]:
+        """
+        :return: the quality string and the required iterations of the proof, or None if the proof is invalid
+        """
+        if self.executor is None:
+            return verify_proof(self.constants, proof_of_space, challenge_hash, sp_hash, difficulty)
+
+        submitted = time.time()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            try:
+                result, started, finished = await self._run_in_worker(
+                    bytes(proof_of_space), challenge_hash, sp_hash, difficulty
+                )
+            except BrokenProcessPool:
+                # A worker died, which fails everything submitted to the pool. The proof is tried once more on a
+                # new pool, so a single crash does not stop all later verifications.
+                if self.executor is None:
+                    raise
+                result, started, finished = await self._run_in_worker(
+                    bytes(proof_of_space), challenge_hash, sp_hash, difficulty
+                )
+        finally:
+            self.in_flight -= 1
+        self.tasks += 1
+        self.queue_seconds += max(0.0, started - submitted)
+        self.run_seconds += finished - started
+        self.max_total_seconds = max(self.max_total_seconds, time.time() - submitted)
+        return result
+
+    async def _run_in_worker(
+        self, proof_of_space: bytes, challenge_hash: bytes32, sp_hash: bytes32, difficulty: uint64
+    ) -> Tuple[Optional[Tuple[bytes32, uint64]], float, float]:
+        executor: ProcessPoolExecutor = self.executor
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                executor, _verify_proof_in_worker, proof_of_space, challenge_hash, sp_hash, difficulty
+            )
+        except BrokenProcessPool:
+            # Concurrent verifications fail together, only the first one replaces the pool
+            if self.executor is executor:
+                logging.error("Proof verification worker died, restarting the workers")
+                executor.shutdown(wait=False)
+                self.executor = self._create_executor()
+                self.restarts += 1
+            raise
+
+    def get_stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "tasks": self.tasks,
+            "avg_queue_ms": 1000 * self.queue_seconds / max(1, self.tasks),
+            "avg_run_ms": 1000 * self.run_seconds / max(1, self.tasks),
+            "max_total_ms": 1000 * self.max_total_seconds,
+            "restarts": self.restarts,
+        }
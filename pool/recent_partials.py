@@ -0,0 +1,51 @@
+from array import array
+from typing import List, Tuple
+
+from chia.util.ints import uint64
+
+
+class RecentPartials:
+    """
+    Fixed size ring buffer with the (timestamp, difficulty) of the most recent partials of one farmer. It holds the
+    same rows as "ORDER BY timestamp DESC LIMIT capacity" on the partial table, without a database read.
+    """
+
+    __slots__ = ("timestamps", "difficulties", "start", "size")
+
+    def __init__(self, capacity: int):
+        self.timestamps = array("Q", [0]) * capacity
+        self.difficulties = array("Q", [0]) * capacity
+        self.start = 0  # Index of the oldest entry
+        self.size = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.timestamps)
+
+    def add(self, timestamp: int, difficulty: int) -> None:
+        if self.size > 0 and timestamp < self.timestamps[(self.start + self.size - 1) % self.capacity]:
+            # Out of order timestamp (for example the clock went backwards), keep the entries sorted
+            entries = sorted(self.get(self.size) + [(uint64(timestamp), uint64(difficulty))])
+            self.start = 0
+            self.size = 0
+            for entry_timestamp, entry_difficulty in entries[-self.capacity :]:
+                self.add(entry_timestamp, entry_difficulty)
+            return
+
+        index = (self.start + self.size) % self.capacity
+        self.timestamps[index] = timestamp
+        self.difficulties[index] = difficulty
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def get(self, count: int) -> List[Tuple[uint64, uint64]]:
+        """
+        :return: up to count most recent (timestamp, difficulty) pairs, newest first
+        """
+        ret: List[Tuple[uint64, uint64]] = []
+        for i in range(min(count, self.size)):
+            index = (self.start + self.size - 1 - i) % self.capacity
+            ret.append((uint64(self.timestamps[index]), uint64(self.difficulties[index])))
+        return ret
@@ -0,0 +1,51 @@
+from typing import List, Set
+
+
+class RecentProofs:
+    """
+    Hashes of the proofs of space received in the last window_seconds, to detect double submissions. The window is
+    split in a fixed number of buckets, each a set of the hashes first seen in that bucket's time span. When time
+    moves past the window, the oldest buckets are dropped as a whole, so memory only holds about one window of
+    proofs, unlike a fixed size cache that covers less time the more partials are received.
+    """
+
+    def __init__(self, window_seconds: float, buckets: int = 10):
+        self.bucket_seconds = window_seconds / buckets
+        # One more bucket than needed, since the newest one only covers part of its time span
+        self.buckets: List[Set[bytes]] = [set() for _ in range(buckets + 1)]
+        # Index of the time span covered by the newest bucket, self.buckets[-1]
+        self.newest = 0
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def _rotate(self, now: float) -> None:
+        current = int(now // self.bucket_seconds)
+        if current <= self.newest:
+            return
+        expired = min(current - self.newest, len(self.buckets))
+        self.buckets = self.buckets[expired:] + [set() for _ in range(expired)]
+        self.newest = current
+
+    def contains(self, proof_hash: bytes, now: float) -> bool:
+        """
+        :return: True if the proof was already received within the window, without adding it
+        """
+        self._rotate(now)
+        return any(proof_hash in bucket for bucket in self.buckets)
+
+    def add(self, proof_hash: bytes, now: float) -> bool:
+        """
+        :return: True if the proof is new, False if it was already received within the window
+        """
+        if self.contains(proof_hash, now):
+            return False
+        self.buckets[-1].add(proof_hash)
+        return True
+
+    def discard(self, proof_hash: bytes) -> None:
+        """
+        Forgets a proof, for example when its partial was rejected for another reason, so it can be submitted again.
+        """
+        for bucket in self.buckets:
+            bucket.discard(proof_hash)
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+from chia.rpc.full_node_rpc_client import FullNodeRpcClient
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_record import CoinRecord
+from chia.util.ints import uint32
+
+from singleton import get_coin_records_by_names
+from store import PoolStore
+
+log = logging
+
+
+class RewardScanner:
+    """
+    Finds the unspent coins sent to the p2_singleton puzzle hashes of the farmers, incrementally. Each scan only asks
+    the full node for the coins confirmed after the last buried height that was scanned, in chunks of chunk_size
+    puzzle hashes queried in parallel, and carries the coins found before in memory. Those are checked again with
+    one batched lookup, and dropped once spent (claimed).
+
+    The height persisted in the store is the last buried height, or just below the oldest coin still unspent,
+    whichever is lower, so that after a restart the first scan finds all the unspent coins again. A puzzle hash
+    that was not scanned before, for a new farmer, is scanned from scan_start_height. full_rescan ignores the
+    persisted height, to recover from a bad database.
+    """
+
+    def __init__(
+        self,
+        node_rpc_client: FullNodeRpcClient,
+        store: PoolStore,
+        scan_start_height: uint32,
+        confirmation_security_threshold: int,
+        chunk_size: int,
+        full_rescan: bool = False,
+    ):
+        self.node_rpc_client = node_rpc_client
+        self.store = store
+        self.scan_start_height = scan_start_height
+        self.confirmation_security_threshold = confirmation_security_threshold
+        self.chunk_size = chunk_size
+        self.full_rescan = full_rescan
+        # All the puzzle hashes are scanned up to this height, None before the first scan
+        self.scanned_height: Optional[uint32] = None
+        self.scanned_puzzle_hashes: Set[bytes32] = set()
+        # Unspent coins found by the previous scans, by name
+        self.coins: Dict[bytes32, CoinRecord] = {}
+
+    async def start(self, puzzle_hashes: Set[bytes32]) -> None:
+        """
+        :param puzzle_hashes: the puzzle hashes of the farmers when the pool starts, they are scanned up to the
+        persisted height
+        """
+        if self.full_rescan:
+            log.info(f"Rescanning pool rewards from height {self.scan_start_height}")
+            return
+        self.scanned_height = await self.store.get_reward_scan_height()
+        if self.scanned_height is not None:
+            self.scanned_puzzle_hashes = set(puzzle_hashes)
+            log.info(f"Scanning pool rewards from height {self.scanned_height + 1}")
+
+    async def _get_coin_records(self, puzzle_hashes: List[bytes32], start_height: uint32) -> List[CoinRecord]:
+        chunks: List[List[CoinRecord]] = await asyncio.gather(
+            *[
+                self.node_rpc_client.get_coin_records_by_puzzle_hashes(
+                    puzzle_hashes[i : i + self.chunk_size], include_spent_coins=False, start_height=start_height
+                )
+                for i in range(0, len(puzzle_hashes), self.chunk_size)
+            ]
+        )
+        return [coin_record for chunk in chunks for coin_record in chunk]
+
+    async def scan(self, puzzle_hashes: Set[bytes32], peak_height: uint32) -> List[CoinRecord]:
+        """
+        :return: all the unspent coins of puzzle_hashes, including the ones that are not buried yet
+        """
+        buried_height = uint32(max(0, peak_height - self.confirmation_security_threshold))
+        if self.scanned_height is None:
+            start_height = self.scan_start_height
+            scanned_puzzle_hashes: Set[bytes32] = set()
+        else:
+            start_height = uint32(min(self.scanned_height, buried_height) + 1)
+            scanned_puzzle_hashes = self.scanned_puzzle_hashes
+
+        # The coins that are not buried are found again by this scan, unless they were reorged out. The state is
+        # only updated at the end, so a failed scan is simply done again.
+        coins: Dict[bytes32, CoinRecord] = {}
+        old_coin_names: List[bytes32] = [
+            name for name, coin_record in self.coins.items() if coin_record.confirmed_block_index < start_height
+        ]
+        if len(old_coin_names) > 0:
+            still_unspent: Dict[bytes32, CoinRecord] = await get_coin_records_by_names(
+                self.node_rpc_client, old_coin_names
+            )
+            coins = {name: coin_record for name, coin_record in still_unspent.items() if not coin_record.spent}
+
+        new_puzzle_hashes: List[bytes32] = list(puzzle_hashes - scanned_puzzle_hashes)
+        known_puzzle_hashes: List[bytes32] = list(puzzle_hashes & scanned_puzzle_hashes)
+        new_coins: List[CoinRecord] = await self._get_coin_records(known_puzzle_hashes, start_height)
+        if len(new_puzzle_hashes) > 0:
+            new_coins += await self._get_coin_records(new_puzzle_hashes, self.scan_start_height)
+        for coin_record in new_coins:
+            coins[coin_record.name] = coin_record
+        log.info(
+            f"Scanned {len(known_puzzle_hashes)} puzzle hashes from height {start_height} and "
+            f"{len(new_puzzle_hashes)} new ones from height {self.scan_start_height}, found {len(new_coins)} coins"
+        )
+
+        persisted_height: uint32 = min(
+            [buried_height] + [uint32(coin_record.confirmed_block_index - 1) for coin_record in coins.values()]
+        )
+        await self.store.set_reward_scan_height(persisted_height)
+        self.coins = coins
+        self.scanned_height = buried_height
+        self.scanned_puzzle_hashes = set(puzzle_hashes)
+        return [coin_record for coin_record in coins.values() if coin_record.coin.puzzle_hash in puzzle_hashes]
@@ -0,0 +1,132 @@
+import asyncio
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# (sp_hash, is_eos), the sp_hash is the challenge hash of the sub slot for an end of sub slot
+SignagePointKey = Tuple[bytes, bool]
+
+
+class SignagePointCache:
+    """
+    Caches full node get_recent_signage_point_or_eos responses, shared by partial validation and confirmation. All
+    farmers submit partials for the same few signage points per sub slot, so almost every lookup is a hit.
+
+    Concurrent lookups of a missing entry are coalesced into a single RPC. An entry is fetched again when it is older
+    than ttl seconds, or when the peak changed since it was fetched, because a new peak can revert a signage point.
+    Responses of None (not seen yet by the node) are not cached.
+
+    Partials that arrive before the full node has the signage point can park on it with wait. A single poller task
+    looks up every signage point with waiters each poll_interval seconds, and wakes all of its waiters as soon as the
+    node has it.
+    """
+
+    def __init__(
+        self, fetch: Callable[[bytes, bool], Awaitable[Optional[Dict]]], ttl: float, poll_interval: float = 0.5
+    ):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        # key -> (response, time fetched, peak header hash when fetched)
+        self.entries: Dict[SignagePointKey, Tuple[Dict, float, Optional[bytes]]] = {}
+        self.in_flight: Dict[SignagePointKey, asyncio.Future] = {}
+        self.peak: Optional[bytes] = None
+        self.waiters: Dict[SignagePointKey, List[asyncio.Future]] = {}
+        self.poll_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    def new_peak(self, peak: Optional[bytes]) -> None:
+        self.peak = peak
+        now = time.time()
+        for key in [key for key, (_, fetched, _) in self.entries.items() if now - fetched > self.ttl]:
+            del self.entries[key]
+
+    def get_cached(self, sp_hash: bytes, is_eos: bool) -> Optional[Dict]:
+        """
+        :return: the cached response, or None if it is not cached or must be fetched again. Never calls the full node.
+        """
+        entry = self.entries.get((sp_hash, is_eos))
+        if entry is None:
+            return None
+        response, fetched, peak = entry
+        if peak != self.peak or time.time() - fetched > self.ttl:
+            return None
+        self.hits += 1
+        return response
+
+    async def get(self, sp_hash: bytes, is_eos: bool) -> Optional[Dict]:
+        response = self.get_cached(sp_hash, is_eos)
+        if response is not None:
+            return response
+
+        key: SignagePointKey = (sp_hash, is_eos)
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            # Runs in its own task, so that a cancelled caller does not cancel the lookup for everyone else
+            task = asyncio.create_task(self._fetch(key))
+            self.in_flight[key] = task
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: SignagePointKey) -> Optional[Dict]:
+        peak = self.peak
+        try:
+            response = await self.fetch(*key)
+            if response is not None:
+                self.entries[key] = (response, time.time(), peak)
+            else:
+                self.entries.pop(key, None)
+            return response
+        finally:
+            del self.in_flight[key]
+
+    async def wait(self, sp_hash: bytes, is_eos: bool, timeout: float) -> Optional[Dict]:
+        """
+        Like get, but if the full node does not have the signage point or EOS yet, waits up to timeout seconds for it
+        to arrive.
+        """
+        response = await self.get(sp_hash, is_eos)
+        if response is not None or timeout <= 0:
+            return response
+
+        key: SignagePointKey = (sp_hash, is_eos)
+        waiter: asyncio.Future = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(key, []).append(waiter)
+        if self.poll_task is None or self.poll_task.done():
+            self.poll_task = asyncio.create_task(self.poll_waiters_loop())
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            key_waiters = self.waiters.get(key)
+            if key_waiters is not None and waiter in key_waiters:
+                key_waiters.remove(waiter)
+                if len(key_waiters) == 0:
+                    del self.waiters[key]
+
+    async def poll_waiters_loop(self) -> None:
+        while len(self.waiters) > 0:
+            await asyncio.sleep(self.poll_interval)
+            keys = list(self.waiters.keys())
+            responses = await asyncio.gather(*[self.get(*key) for key in keys], return_exceptions=True)
+            for key, response in zip(keys, responses):
+                if isinstance(response, Exception):
+                    logging.warning(f"Error looking up signage point or EOS {key[0]}: {response}")
+                    continue
+                if response is None:
+                    continue
+                for waiter in self.waiters.pop(key, []):
+                    if not waiter.done():
+                        waiter.set_result(response)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "waiting": sum(len(key_waiters) for key_waiters in self.waiters.values()),
+        }
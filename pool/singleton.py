@@ -1,6 +1,9 @@
-from typing import List, Optional, Tuple
+import asyncio
+import contextlib
+from typing import Dict, List, Optional, Set, Tuple
 import logging
 
+import aiohttp
 from blspy import G2Element
 from chia.consensus.coinbase import pool_parent_id
 from chia.pools.pool_puzzles import (
@@ -16,9 +19,12 @@ from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.coin_record import CoinRecord
 from chia.types.coin_solution import CoinSolution
 from chia.types.spend_bundle import SpendBundle
+from chia.util.byte_types import hexstr_to_bytes
 from chia.util.ints import uint32
 
+from pool_parent_index import PoolParentIndex
 from store import FarmerRecord
+from striped_lock import StripedLock
 
 log = logging
 log.basicConfig(level=logging.INFO)
@@ -30,83 +36,416 @@ async def get_coin_spend(node_rpc_client: FullNodeRpcClient, coin_record: CoinRe
     return await node_rpc_client.get_puzzle_and_solution(coin_record.coin.name(), coin_record.spent_block_index)
 
 
-async def get_singleton_state(
-    node_rpc_client: FullNodeRpcClient,
-    launcher_id: bytes32,
-    farmer_record: Optional[FarmerRecord],
-    peak_height: uint32,
-    confirmation_security_threshold: int,
-) -> Optional[Tuple[CoinSolution, PoolState]]:
+async def _get_coin_record_by_name(node_rpc_client: FullNodeRpcClient, name: bytes32) -> Optional[CoinRecord]:
+    """
+    Like FullNodeRpcClient.get_coin_record_by_name, but only returns None if the node does not know the coin. Other
+    errors are raised, instead of being mistaken for a missing coin.
+    """
     try:
-        if farmer_record is None:
-            launcher_coin: Optional[CoinRecord] = await node_rpc_client.get_coin_record_by_name(launcher_id)
+        response = await node_rpc_client.fetch("get_coin_record_by_name", {"name": name.hex()})
+    except ValueError:
+        return None
+    return CoinRecord.from_json_dict(response["coin_record"])
+
+
+async def get_coin_records_by_names(
+    node_rpc_client: FullNodeRpcClient, names: List[bytes32], chunk_size: int = 1000
+) -> Dict[bytes32, CoinRecord]:
+    """
+    Looks up many coin records (spent or not) with a few RPCs, chunk_size names at a time. Falls back to one RPC per
+    name if the full node does not support get_coin_records_by_names.
+    """
+    records: Dict[bytes32, CoinRecord] = {}
+    supported = True
+    for i in range(0, len(names), chunk_size):
+        chunk = names[i : i + chunk_size]
+        chunk_records: Optional[List[CoinRecord]] = None
+        if supported:
+            try:
+                response = await node_rpc_client.fetch(
+                    "get_coin_records_by_names", {"names": [name.hex() for name in chunk], "include_spent_coins": True}
+                )
+                chunk_records = [CoinRecord.from_json_dict(coin_record) for coin_record in response["coin_records"]]
+            except aiohttp.ClientResponseError as e:
+                # Older full nodes do not have the endpoint, the remaining chunks are looked up one by one too
+                if e.status != 404:
+                    raise
+                supported = False
+            except ValueError:
+                # The node failed the request, this chunk is looked up one by one
+                pass
+        if chunk_records is None:
+            chunk_records = [
+                coin_record
+                for coin_record in await asyncio.gather(
+                    *[_get_coin_record_by_name(node_rpc_client, name) for name in chunk]
+                )
+                if coin_record is not None
+            ]
+        for coin_record in chunk_records:
+            records[coin_record.name] = coin_record
+    return records
+
+
+async def get_removed_coin_names(
+    node_rpc_client: FullNodeRpcClient, start_height: int, end_height: int, chunk_size: int = 100
+) -> Tuple[Set[bytes32], Optional[bytes32], Optional[bytes32]]:
+    """
+    Looks up the coins spent in the blocks from start_height to end_height (excluded).
+    :return: the names of the removed coins, the prev_hash of the first block and the header hash of the last one,
+    to detect reorgs between calls. The hashes are None if the node has none of these blocks.
+    """
+    block_records: List[Dict] = []
+    for height in range(start_height, end_height, chunk_size):
+        block_records += await node_rpc_client.get_block_records(height, min(height + chunk_size, end_height))
+    if len(block_records) == 0:
+        return set(), None, None
+
+    # Only transaction blocks spend coins, they are the ones with a timestamp
+    header_hashes: List[bytes32] = [
+        bytes32(hexstr_to_bytes(block_record["header_hash"]))
+        for block_record in block_records
+        if block_record["timestamp"] is not None
+    ]
+    removed: Set[bytes32] = set()
+    for i in range(0, len(header_hashes), chunk_size):
+        for _, removals in await asyncio.gather(
+            *[
+                node_rpc_client.get_additions_and_removals(header_hash)
+                for header_hash in header_hashes[i : i + chunk_size]
+            ]
+        ):
+            removed.update(coin_record.name for coin_record in removals)
+    return (
+        removed,
+        bytes32(hexstr_to_bytes(block_records[0]["prev_hash"])),
+        bytes32(hexstr_to_bytes(block_records[-1]["header_hash"])),
+    )
+
+
+class SingletonTrack:
+    """
+    What SingletonFollower knows about one singleton. buried_solution and buried_state are the last spend that is
+    buried under confirmation_security_threshold blocks, and its latest non None pool state. pending holds the newer
+    spends, oldest first, as (spent height, spend, latest non None pool state). tip_name is the name of the unspent
+    singleton coin, once it was looked up.
+    """
+
+    __slots__ = ("buried_solution", "buried_state", "pending", "tip_name")
+
+    def __init__(self, buried_solution: CoinSolution, buried_state: PoolState):
+        self.buried_solution = buried_solution
+        self.buried_state = buried_state
+        self.pending: List[Tuple[uint32, CoinSolution, PoolState]] = []
+        self.tip_name: Optional[bytes32] = None
+
+    @property
+    def latest_solution(self) -> CoinSolution:
+        return self.pending[-1][1] if len(self.pending) > 0 else self.buried_solution
+
+    @property
+    def latest_state(self) -> PoolState:
+        return self.pending[-1][2] if len(self.pending) > 0 else self.buried_state
+
+    def bury(self, buried_height: int) -> None:
+        while len(self.pending) > 0 and self.pending[0][0] < buried_height:
+            _, self.buried_solution, self.buried_state = self.pending.pop(0)
+
+    def get_state(self, buried_height: int) -> Tuple[CoinSolution, PoolState]:
+        """
+        :return: the last spend below buried_height, and its latest non None pool state
+        """
+        solution, state = self.buried_solution, self.buried_state
+        for spent_height, pending_solution, pending_state in self.pending:
+            if spent_height >= buried_height:
+                break
+            solution, state = pending_solution, pending_state
+        return solution, state
+
+
+class SingletonFollower:
+    """
+    Follows the lineage of many singletons incrementally. Each call only fetches the spends that happened since the
+    previous one, and looks up the coin records of all the followed singletons together with
+    get_coin_records_by_names, instead of walking each singleton from its stored tip with one RPC per coin.
+    Spends that are not buried yet are checked again on every call, and forgotten if they were reorged out. A
+    singleton whose lookup fails keeps what was already followed, and is picked up again by the next call.
+    """
+
+    def __init__(self, node_rpc_client: FullNodeRpcClient, confirmation_security_threshold: int):
+        self.node_rpc_client = node_rpc_client
+        self.confirmation_security_threshold = confirmation_security_threshold
+        self.tracks: Dict[bytes32, SingletonTrack] = {}
+        # The launcher id of each singleton, by the name of its unspent coin
+        self.launcher_by_tip: Dict[bytes32, bytes32] = {}
+        # Calls for different singletons run concurrently, calls for the same singleton one after the other
+        self.locks = StripedLock()
+
+    def forget(self, launcher_id: bytes32) -> None:
+        track: Optional[SingletonTrack] = self.tracks.pop(launcher_id, None)
+        if track is not None:
+            self._clear_tip(track)
+
+    def _clear_tip(self, track: SingletonTrack) -> None:
+        if track.tip_name is not None:
+            self.launcher_by_tip.pop(track.tip_name, None)
+            track.tip_name = None
+
+    def _set_tip(self, launcher_id: bytes32, tip_name: bytes32) -> None:
+        track: SingletonTrack = self.tracks[launcher_id]
+        self._clear_tip(track)
+        track.tip_name = tip_name
+        self.launcher_by_tip[tip_name] = launcher_id
+
+    def get_stale_launcher_ids(self, removed_coin_names: Set[bytes32]) -> Set[bytes32]:
+        """
+        :return: the followed singletons whose state can differ from the last call, because their unspent coin was
+        spent in one of removed_coin_names, because some of their spends were not buried yet, or because their last
+        lookup failed
+        """
+        stale: Set[bytes32] = {
+            launcher_id
+            for launcher_id, track in self.tracks.items()
+            if track.tip_name is None or len(track.pending) > 0
+        }
+        for coin_name in removed_coin_names:
+            launcher_id: Optional[bytes32] = self.launcher_by_tip.get(coin_name)
+            if launcher_id is not None:
+                stale.add(launcher_id)
+        return stale
+
+    async def get_singleton_states(
+        self,
+        farmer_records: Dict[bytes32, Optional[FarmerRecord]],
+        peak_height: uint32,
+        confirmation_security_threshold: Optional[int] = None,
+    ) -> Dict[bytes32, Optional[Tuple[CoinSolution, PoolState]]]:
+        """
+        :param farmer_records: the singletons to look up, by launcher id, with their farmer record if known. A
+        singleton that is not followed yet starts from the tip in its farmer record, or from its launcher spend.
+        :param confirmation_security_threshold: number of blocks a spend must be buried under to be returned,
+        at most the one of the follower. Defaults to the one of the follower.
+        :return: for each launcher id, the last spend buried under confirmation_security_threshold blocks and its
+        latest non None pool state, or None if the singleton is invalid. The singletons that could not be looked up,
+        because of an error of the full node, are left out.
+        """
+        if confirmation_security_threshold is None:
+            confirmation_security_threshold = self.confirmation_security_threshold
+        assert confirmation_security_threshold <= self.confirmation_security_threshold
+        failed: Set[bytes32] = set()
+        async with contextlib.AsyncExitStack() as stack:
+            for lock in self.locks.ordered(farmer_records.keys()):
+                await stack.enter_async_context(lock)
+            await self._start_tracks(farmer_records, failed)
+            await self._update_tracks(
+                [launcher_id for launcher_id in farmer_records.keys() if launcher_id not in failed], peak_height, failed
+            )
+
+        results: Dict[bytes32, Optional[Tuple[CoinSolution, PoolState]]] = {}
+        for launcher_id in farmer_records.keys():
+            if launcher_id in failed:
+                continue
+            track: Optional[SingletonTrack] = self.tracks.get(launcher_id)
+            if track is None:
+                results[launcher_id] = None
+            else:
+                results[launcher_id] = track.get_state(peak_height - confirmation_security_threshold)
+        return results
+
+    async def _get_coin_records(
+        self, names_by_launcher: Dict[bytes32, List[bytes32]], failed: Set[bytes32]
+    ) -> Dict[bytes32, CoinRecord]:
+        """
+        Looks up the coin records of the names of all the launchers together. If that fails, all these launchers are
+        added to failed.
+        """
+        names: List[bytes32] = [name for launcher_names in names_by_launcher.values() for name in launcher_names]
+        if len(names) == 0:
+            return {}
+        try:
+            return await get_coin_records_by_names(self.node_rpc_client, names)
+        except Exception as e:
+            log.error(f"Error looking up the coins of {len(names_by_launcher)} singletons: {e}")
+            failed.update(names_by_launcher.keys())
+            return {}
+
+    async def _get_coin_spends(
+        self, coin_records: Dict[bytes32, CoinRecord], failed: Set[bytes32]
+    ) -> Dict[bytes32, CoinSolution]:
+        """
+        Looks up the spends of the spent coins, by launcher id. The launchers whose spend could not be looked up are
+        added to failed.
+        """
+        spends: Dict[bytes32, CoinSolution] = {}
+        for (launcher_id, coin_record), solution in zip(
+            coin_records.items(),
+            await asyncio.gather(
+                *[get_coin_spend(self.node_rpc_client, coin_record) for coin_record in coin_records.values()],
+                return_exceptions=True,
+            ),
+        ):
+            # The node has the spend of every spent coin, a missing one is an error of the RPC
+            if solution is None or isinstance(solution, BaseException):
+                log.error(f"Error looking up the spend of {coin_record.name} of singleton {launcher_id}: {solution}")
+                failed.add(launcher_id)
+            else:
+                spends[launcher_id] = solution
+        return spends
+
+    async def _start_tracks(self, farmer_records: Dict[bytes32, Optional[FarmerRecord]], failed: Set[bytes32]) -> None:
+        launcher_ids: List[bytes32] = []
+        for launcher_id, farmer_record in farmer_records.items():
+            if launcher_id in self.tracks:
+                continue
+            if farmer_record is not None:
+                self.tracks[launcher_id] = SingletonTrack(
+                    farmer_record.singleton_tip, farmer_record.singleton_tip_state
+                )
+            else:
+                launcher_ids.append(launcher_id)
+
+        launcher_coins: Dict[bytes32, CoinRecord] = await self._get_coin_records(
+            {launcher_id: [launcher_id] for launcher_id in launcher_ids}, failed
+        )
+        spent: Dict[bytes32, CoinRecord] = {}
+        for launcher_id in launcher_ids:
+            if launcher_id in failed:
+                continue
+            launcher_coin: Optional[CoinRecord] = launcher_coins.get(launcher_id)
             if launcher_coin is None:
                 log.warning(f"Can not find genesis coin {launcher_id}")
-                return None
-            if not launcher_coin.spent:
+            elif not launcher_coin.spent:
                 log.warning(f"Genesis coin {launcher_id} not spent")
-                return None
+            else:
+                spent[launcher_id] = launcher_coin
 
-            last_solution: Optional[CoinSolution] = await get_coin_spend(node_rpc_client, launcher_coin)
-            saved_state = solution_to_extra_data(last_solution)
-            assert last_solution is not None and saved_state is not None
-        else:
-            last_solution = farmer_record.singleton_tip
-            saved_state = farmer_record.singleton_tip_state
+        for launcher_id, launcher_solution in (await self._get_coin_spends(spent, failed)).items():
+            try:
+                launcher_state: Optional[PoolState] = solution_to_extra_data(launcher_solution)
+            except Exception as e:
+                log.warning(f"Invalid launcher spend {launcher_id}: {e}")
+                continue
+            if launcher_state is None:
+                log.warning(f"Invalid launcher spend {launcher_id}")
+                continue
+            self.tracks[launcher_id] = SingletonTrack(launcher_solution, launcher_state)
 
-        saved_solution = last_solution
-        last_not_none_state: PoolState = saved_state
-        assert last_solution is not None
+    async def _update_tracks(self, launcher_ids: List[bytes32], peak_height: uint32, failed: Set[bytes32]) -> None:
+        tracks: Dict[bytes32, SingletonTrack] = {
+            launcher_id: self.tracks[launcher_id] for launcher_id in launcher_ids if launcher_id in self.tracks
+        }
+        # The tips are set again once they are found, so a track whose update fails or is cancelled stays stale
+        for track in tracks.values():
+            self._clear_tip(track)
 
-        last_coin_record: Optional[CoinRecord] = await node_rpc_client.get_coin_record_by_name(
-            last_solution.coin.name()
+        # Forgets the spends that are no longer in the blockchain, after a reorg
+        pending_coins: Dict[bytes32, CoinRecord] = await self._get_coin_records(
+            {
+                launcher_id: [solution.coin.name() for _, solution, _ in track.pending]
+                for launcher_id, track in tracks.items()
+                if len(track.pending) > 0
+            },
+            failed,
         )
-        assert last_coin_record is not None
+        for launcher_id, track in tracks.items():
+            if launcher_id in failed:
+                continue
+            for i, (spent_height, solution, _) in enumerate(track.pending):
+                coin_record: Optional[CoinRecord] = pending_coins.get(solution.coin.name())
+                if coin_record is None or not coin_record.spent or coin_record.spent_block_index != spent_height:
+                    log.info(f"Singleton {launcher_id} spend at height {spent_height} was reorged out")
+                    del track.pending[i:]
+                    break
 
-        while True:
-            # Get next coin solution
-            next_coin: Optional[Coin] = get_most_recent_singleton_coin_from_coin_solution(last_solution)
+        # Follows the lineage of all the singletons, one coin of each per round
+        frontier: Dict[bytes32, bytes32] = {}
+        for launcher_id, track in tracks.items():
+            if launcher_id in failed:
+                continue
+            next_coin: Optional[Coin] = get_most_recent_singleton_coin_from_coin_solution(track.latest_solution)
             if next_coin is None:
                 # This means the singleton is invalid
-                return None
-            next_coin_record: Optional[CoinRecord] = await node_rpc_client.get_coin_record_by_name(next_coin.name())
-            assert next_coin_record is not None
+                self.forget(launcher_id)
+                continue
+            frontier[launcher_id] = next_coin.name()
 
-            if not next_coin_record.spent:
-                break
+        while len(frontier) > 0:
+            coin_records: Dict[bytes32, CoinRecord] = await self._get_coin_records(
+                {launcher_id: [coin_name] for launcher_id, coin_name in frontier.items()}, failed
+            )
+            spent: Dict[bytes32, CoinRecord] = {}
+            for launcher_id, coin_name in frontier.items():
+                if launcher_id in failed:
+                    continue
+                coin_record: Optional[CoinRecord] = coin_records.get(coin_name)
+                if coin_record is None:
+                    log.warning(f"Can not find coin {coin_name} of singleton {launcher_id}")
+                    self.forget(launcher_id)
+                elif coin_record.spent:
+                    spent[launcher_id] = coin_record
+                else:
+                    self._set_tip(launcher_id, coin_name)
 
-            last_solution: Optional[CoinSolution] = await get_coin_spend(node_rpc_client, next_coin_record)
-            assert last_solution is not None
+            frontier = {}
+            for launcher_id, solution in (await self._get_coin_spends(spent, failed)).items():
+                track = tracks[launcher_id]
+                try:
+                    next_coin = get_most_recent_singleton_coin_from_coin_solution(solution)
+                    pool_state: Optional[PoolState] = solution_to_extra_data(solution)
+                except Exception as e:
+                    log.warning(f"Invalid spend of singleton {launcher_id}: {e}")
+                    next_coin = None
+                if next_coin is None:
+                    log.warning(f"Invalid spend of singleton {launcher_id}")
+                    self.forget(launcher_id)
+                    continue
+                track.pending.append(
+                    (
+                        spent[launcher_id].spent_block_index,
+                        solution,
+                        pool_state if pool_state is not None else track.latest_state,
+                    )
+                )
+                frontier[launcher_id] = next_coin.name()
 
-            pool_state: Optional[PoolState] = solution_to_extra_data(last_solution)
+        for track in tracks.values():
+            track.bury(peak_height - self.confirmation_security_threshold)
 
-            if pool_state is not None:
-                last_not_none_state = pool_state
-            if peak_height - confirmation_security_threshold > next_coin_record.spent_block_index:
-                # There is a state transition, and it is sufficiently buried
-                saved_solution = last_solution
-                saved_state = last_not_none_state
 
-        return saved_solution, saved_state
-    except Exception as e:
-        log.error(f"Error getting singleton: {e}")
-        return None
+def get_pool_reward_height(
+    reward_coin_record: CoinRecord, genesis_challenge: bytes32, pool_parent_index: Optional[PoolParentIndex] = None
+) -> Optional[uint32]:
+    """
+    :return: the height the pool reward was farmed at, or None if the coin is not a pool reward
+    """
+    if pool_parent_index is not None:
+        found_block_index: Optional[uint32] = pool_parent_index.get_height(reward_coin_record.coin.parent_coin_info)
+        if found_block_index is not None:
+            return found_block_index
+    # Older than the index, the reward is confirmed less than 100 blocks after it was farmed
+    for block_index in range(
+        reward_coin_record.confirmed_block_index, reward_coin_record.confirmed_block_index - 100, -1
+    ):
+        if block_index < 0:
+            break
+        if pool_parent_id(uint32(block_index), genesis_challenge) == reward_coin_record.coin.parent_coin_info:
+            return uint32(block_index)
+    return None
 
 
 async def create_absorb_transaction(
     node_rpc_client: FullNodeRpcClient,
     farmer_record: FarmerRecord,
-    peak_height: uint32,
+    singleton_state: Tuple[CoinSolution, PoolState],
     reward_coin_records: List[CoinRecord],
     genesis_challenge: bytes32,
+    pool_parent_index: Optional[PoolParentIndex] = None,
 ) -> Optional[SpendBundle]:
-    singleton_state_tuple: Optional[Tuple[CoinSolution, PoolState]] = await get_singleton_state(
-        node_rpc_client, farmer_record.launcher_id, farmer_record, peak_height, 0
-    )
-    if singleton_state_tuple is None:
-        log.info(f"Invalid singleton {farmer_record.launcher_id}.")
-        return None
-    last_solution, last_state = singleton_state_tuple
+    """
+    :param singleton_state: the latest spend of the singleton and its pool state, from
+    SingletonFollower.get_singleton_states with a confirmation_security_threshold of 0
+    """
+    last_solution, last_state = singleton_state
 
     if last_state.state == PoolSingletonState.SELF_POOLING:
         log.info(f"Don't try to absorb from former farmer {farmer_record.launcher_id}.")
@@ -119,16 +458,10 @@ async def create_absorb_transaction(
 
     all_spends: List[CoinSolution] = []
     for reward_coin_record in reward_coin_records:
-        found_block_index: Optional[uint32] = None
-        for block_index in range(
-            reward_coin_record.confirmed_block_index, reward_coin_record.confirmed_block_index - 100, -1
-        ):
-            if block_index < 0:
-                break
-            pool_parent = pool_parent_id(uint32(block_index), genesis_challenge)
-            if pool_parent == reward_coin_record.coin.parent_coin_info:
-                found_block_index = uint32(block_index)
-        if not found_block_index:
+        found_block_index: Optional[uint32] = get_pool_reward_height(
+            reward_coin_record, genesis_challenge, pool_parent_index
+        )
+        if found_block_index is None:
             # The puzzle does not allow spending coins that are not a coinbase reward
             log.info(f"Received reward {reward_coin_record.coin} that is not a pool reward.")
             continue
@@ -143,6 +476,5 @@ async def create_absorb_transaction(
         )
         last_solution = absorb_spend[0]
         all_spends += absorb_spend
-        # TODO(pool): handle the case where the cost exceeds the size of the block
 
     return SpendBundle(all_spends, G2Element())
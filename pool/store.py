@@ -1,17 +1,24 @@
 import asyncio
+import contextlib
+import dataclasses
+import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Set, List, Tuple, Dict
+from typing import AsyncIterator, Optional, Set, List, Tuple, Dict
 
 import aiosqlite
 from blspy import G1Element
 from chia.pools.pool_wallet_info import PoolState
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.coin_solution import CoinSolution
-from chia.util.ints import uint64
+from chia.util.ints import uint32, uint64
+from chia.util.lru_cache import LRUCache
 
 from chia.util.streamable import streamable, Streamable
 
+from bls_cache import g1_element_cache
+from recent_partials import RecentPartials
+
 
 @dataclass(frozen=True)
 @streamable
@@ -29,29 +36,167 @@ class FarmerRecord(Streamable):
     is_pool_member: bool  # If the farmer leaves the pool, this gets set to False
 
 
+@dataclass(frozen=True)
+class FarmerHotState:
+    """
+    The fields of a farmer that are needed to validate partials, read without the singleton_tip and
+    singleton_tip_state columns so that a cache miss does not fetch and decode them.
+    """
+
+    launcher_id: bytes32
+    p2_singleton_puzzle_hash: bytes32
+    authentication_public_key: G1Element
+    difficulty: uint64
+    is_pool_member: bool
+
+    @classmethod
+    def from_farmer_record(cls, farmer_record: FarmerRecord) -> "FarmerHotState":
+        return cls(
+            farmer_record.launcher_id,
+            farmer_record.p2_singleton_puzzle_hash,
+            farmer_record.authentication_public_key,
+            farmer_record.difficulty,
+            farmer_record.is_pool_member,
+        )
+
+
+HOT_STATE_FIELDS = {field.name for field in dataclasses.fields(FarmerHotState)}
+
+# Version 1 stored keys as hex text, version 2 stores them as blobs, version 3 moves the points of each farmer from
+# the farmer table into the farmer_points ledger
+SCHEMA_VERSION = 3
+MIGRATION_CHUNK_SIZE = 10000
+
+FARMER_COLUMNS = [
+    "launcher_id",
+    "p2_singleton_puzzle_hash",
+    "delay_time",
+    "delay_puzzle_hash",
+    "authentication_public_key",
+    "singleton_tip",
+    "singleton_tip_state",
+    "difficulty",
+    "payout_instructions",
+    "is_pool_member",
+]
+
+# Farmer rows in FarmerRecord order, with the points of the epoch given as the first parameter
+SELECT_FARMER_RECORD = (
+    "SELECT farmer.launcher_id, p2_singleton_puzzle_hash, delay_time, delay_puzzle_hash, authentication_public_key,"
+    " singleton_tip, singleton_tip_state, COALESCE(farmer_points.points, 0), difficulty, payout_instructions,"
+    " is_pool_member from farmer"
+    " LEFT JOIN farmer_points ON farmer_points.epoch=? AND farmer_points.launcher_id=farmer.launcher_id"
+)
+
+
 class PoolStore:
     connection: aiosqlite.Connection
-    lock: asyncio.Lock
+    farmer_record_cache: LRUCache
+    farmer_hot_state_cache: LRUCache
 
     @classmethod
-    async def create(cls):
+    async def create(
+        cls,
+        farmer_record_cache_size: int = 10000,
+        partial_batch_size: int = 100,
+        partial_flush_interval: float = 1.0,
+        synchronous: int = 2,
+        recent_partials_size: int = 300,
+        read_connections: int = 0,
+    ):
         self = cls()
         self.db_path = Path("pooldb.sqlite")
         self.connection = await aiosqlite.connect(self.db_path)
-        self.lock = asyncio.Lock()
+
+        # Write-through cache of decoded farmer records. Every write to the farmer table must also update (or drop)
+        # the cached entry, and bumps the generation so that reads racing with a write do not cache stale rows.
+        self.farmer_record_cache = LRUCache(farmer_record_cache_size)
+        self.farmer_hot_state_cache = LRUCache(farmer_record_cache_size)
+        self.farmer_record_cache_hits = 0
+        self.farmer_record_cache_misses = 0
+        self.farmer_record_generation = 0
+
+        # Confirmed partials are buffered and written in one transaction once partial_batch_size rows are pending,
+        # or at the latest every partial_flush_interval seconds. That bounds what a crash can lose, on top of the
+        # guarantee given by the sqlite synchronous level. A batch size of 1 commits every partial immediately.
+        self.partial_batch_size = partial_batch_size
+        self.partial_flush_interval = partial_flush_interval
+        self.pending_partials: List[Tuple[bytes32, uint64, uint64]] = []
+        self.pending_points: Dict[bytes32, int] = {}
+        # The batch that is being committed, still added to reads until the commit is done
+        self.flushing_partials: List[Tuple[bytes32, uint64, uint64]] = []
+        self.flushing_points: Dict[bytes32, int] = {}
+        self.flushes = 0
+        # Held for every transaction on the writer connection. A commit or rollback applies to everything executed on
+        # the connection since the last one, so two writers interleaving there could commit or undo part of each other.
+        self.writer_lock = asyncio.Lock()
+
+        # The last recent_partials_size partials of every farmer, so get_recent_partials (used for every difficulty
+        # decision) does not need to read from the database
+        self.recent_partials_size = recent_partials_size
+        self.recent_partials: Dict[bytes32, RecentPartials] = {}
+
         await self.connection.execute("pragma journal_mode=wal")
-        await self.connection.execute("pragma synchronous=2")
+        await self.connection.execute(f"pragma synchronous={int(synchronous)}")
+        await self.connection.execute("CREATE TABLE IF NOT EXISTS schema_version(version int)")
+        version = await self._get_schema_version()
+        if version == 0 and await self._table_exists("farmer"):
+            # Databases created before the schema_version table existed use the version 1 layout
+            version = 1
+        if version == 0:
+            await self._create_tables("")
+            await self._set_schema_version(SCHEMA_VERSION)
+        elif version < SCHEMA_VERSION:
+            await self._migrate(version)
+
+        await self.connection.execute("CREATE INDEX IF NOT EXISTS scan_ph on farmer(p2_singleton_puzzle_hash)")
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS payout_instructions_index on farmer(payout_instructions)"
+        )
+        # Height up to which the pool rewards were scanned, see RewardScanner
+        await self.connection.execute("CREATE TABLE IF NOT EXISTS reward_scan(height bigint)")
+        await self.connection.execute("CREATE INDEX IF NOT EXISTS timestamp_index on partial(timestamp)")
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS launcher_id_timestamp_index on partial(launcher_id, timestamp)"
+        )
+
+        # Points are accumulated into numbered epochs. Confirmed partials always go to the newest (current) epoch, a
+        # payout closes it and distributes its points while the next epoch keeps accumulating.
+        cursor = await self.connection.execute("SELECT MAX(epoch) from points_epoch")
+        self.points_epoch: int = (await cursor.fetchone())[0] or 0
+        await cursor.close()
+        if self.points_epoch == 0:
+            self.points_epoch = 1
+            await self.connection.execute("INSERT into points_epoch VALUES(?, 0)", (self.points_epoch,))
+
+        await self.connection.commit()
+
+        await self._load_recent_partials()
+
+        # SELECT-only methods run on a pool of read-only connections, so they do not queue behind writes on the
+        # writer connection (WAL allows readers concurrently with the writer). Reads only see committed data, the
+        # partials that are buffered or being flushed are added by _read_unflushed.
+        self.read_connections: Optional[asyncio.Queue] = None
+        if read_connections > 0:
+            self.read_connections = asyncio.Queue()
+            for _ in range(read_connections):
+                read_connection = await aiosqlite.connect(f"file:{self.db_path}?mode=ro", uri=True)
+                self.read_connections.put_nowait(read_connection)
+        self.flush_partials_task = asyncio.create_task(self.flush_partials_loop())
+
+        return self
+
+    async def _create_tables(self, suffix: str) -> None:
         await self.connection.execute(
             (
-                "CREATE TABLE IF NOT EXISTS farmer("
-                "launcher_id text PRIMARY KEY,"
-                " p2_singleton_puzzle_hash text,"
+                f"CREATE TABLE IF NOT EXISTS farmer{suffix}("
+                "launcher_id blob PRIMARY KEY,"
+                " p2_singleton_puzzle_hash blob,"
                 " delay_time bigint,"
-                " delay_puzzle_hash text,"
-                " authentication_public_key text,"
+                " delay_puzzle_hash blob,"
+                " authentication_public_key blob,"
                 " singleton_tip blob,"
                 " singleton_tip_state blob,"
-                " points bigint,"
                 " difficulty bigint,"
                 " payout_instructions text,"
                 " is_pool_member tinyint)"
@@ -59,25 +204,244 @@ class PoolStore:
         )
 
         await self.connection.execute(
-            "CREATE TABLE IF NOT EXISTS partial(launcher_id text, timestamp bigint, difficulty bigint)"
+            f"CREATE TABLE IF NOT EXISTS partial{suffix}(launcher_id blob, timestamp bigint, difficulty bigint)"
         )
 
-        await self.connection.execute("CREATE INDEX IF NOT EXISTS scan_ph on farmer(p2_singleton_puzzle_hash)")
-        await self.connection.execute("CREATE INDEX IF NOT EXISTS timestamp_index on partial(timestamp)")
-        await self.connection.execute("CREATE INDEX IF NOT EXISTS launcher_id_index on partial(launcher_id)")
+        # Raw partials older than the retention window are compacted into one row per farmer and hour
+        await self.connection.execute(
+            (
+                f"CREATE TABLE IF NOT EXISTS partial_hourly{suffix}("
+                "launcher_id blob,"
+                " hour bigint,"
+                " count bigint,"
+                " difficulty bigint,"
+                " PRIMARY KEY(launcher_id, hour))"
+            )
+        )
 
-        await self.connection.commit()
+        await self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS points_epoch{suffix}(epoch bigint PRIMARY KEY, paid tinyint)"
+        )
+        await self.connection.execute(
+            (
+                f"CREATE TABLE IF NOT EXISTS farmer_points{suffix}("
+                "epoch bigint,"
+                " launcher_id blob,"
+                " points bigint,"
+                " PRIMARY KEY(epoch, launcher_id))"
+            )
+        )
 
-        return self
+    async def _get_schema_version(self) -> int:
+        cursor = await self.connection.execute("SELECT MAX(version) from schema_version")
+        row = await cursor.fetchone()
+        await cursor.close()
+        return 0 if row[0] is None else row[0]
+
+    async def _set_schema_version(self, version: int) -> None:
+        await self.connection.execute("DELETE from schema_version")
+        await self.connection.execute("INSERT into schema_version VALUES(?)", (version,))
+
+    async def _table_exists(self, name: str) -> bool:
+        cursor = await self.connection.execute("SELECT 1 from sqlite_master WHERE type='table' AND name=?", (name,))
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row is not None
+
+    async def _migrate(self, version: int) -> None:
+        """
+        Migrates a version 1 or 2 database to the current schema. The rows are copied into new tables in chunks of
+        MIGRATION_CHUNK_SIZE, one transaction each, converting hex keys to blobs for version 1. The copy keeps rowids,
+        so an interrupted migration resumes where it left off the next time the pool starts. The points of every
+        farmer become the first points epoch.
+        """
+        logging.info(f"Migrating pool database from schema version {version} to {SCHEMA_VERSION}")
+        hex_keys = version == 1
+        await self._create_tables("_new")
+        await self._copy_table_in_chunks(
+            "farmer",
+            "farmer_new",
+            FARMER_COLUMNS,
+            {"launcher_id", "p2_singleton_puzzle_hash", "delay_puzzle_hash", "authentication_public_key"}
+            if hex_keys
+            else set(),
+        )
+        await self._copy_table_in_chunks(
+            "partial", "partial_new", ["launcher_id", "timestamp", "difficulty"], {"launcher_id"} if hex_keys else set()
+        )
+        await self._copy_table_in_chunks(
+            "partial_hourly",
+            "partial_hourly_new",
+            ["launcher_id", "hour", "count", "difficulty"],
+            {"launcher_id"} if hex_keys else set(),
+        )
+
+        # The points are moved into the first epoch, the tables swapped and the version written in one transaction.
+        # Otherwise a crash in between would find farmer without its points column, or migrate the already
+        # converted tables again, on the next start.
+        await self.connection.execute("BEGIN")
+        try:
+            cursor = await self.connection.execute("SELECT launcher_id, points from farmer WHERE points>0")
+            farmer_points = await cursor.fetchall()
+            await cursor.close()
+            await self.connection.executemany(
+                "INSERT OR REPLACE into farmer_points_new VALUES(1, ?, ?)",
+                [
+                    (bytes.fromhex(launcher_id) if hex_keys else launcher_id, points)
+                    for launcher_id, points in farmer_points
+                ],
+            )
+            await self.connection.execute("INSERT OR REPLACE into points_epoch_new VALUES(1, 0)")
+
+            for table in ("farmer", "partial", "partial_hourly", "points_epoch", "farmer_points"):
+                await self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+                await self.connection.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+            await self._set_schema_version(SCHEMA_VERSION)
+            await self.connection.commit()
+        except Exception:
+            await self.connection.rollback()
+            raise
+        logging.info(f"Migrated pool database to schema version {SCHEMA_VERSION}")
+
+    async def _copy_table_in_chunks(self, source: str, target: str, columns: List[str], hex_columns: Set[str]) -> None:
+        if not await self._table_exists(source):
+            return
+        cursor = await self.connection.execute(f"SELECT MAX(rowid) from {target}")
+        last_rowid = (await cursor.fetchone())[0] or 0
+        await cursor.close()
+        columns = ["rowid"] + columns
+        while True:
+            cursor = await self.connection.execute(
+                f'SELECT {", ".join(columns)} from {source} WHERE rowid>? ORDER BY rowid LIMIT ?',
+                (last_rowid, MIGRATION_CHUNK_SIZE),
+            )
+            rows = await cursor.fetchall()
+            await cursor.close()
+            if len(rows) == 0:
+                return
+            converted = [
+                tuple(
+                    bytes.fromhex(value) if column in hex_columns and value is not None else value
+                    for column, value in zip(columns, row)
+                )
+                for row in rows
+            ]
+            await self.connection.executemany(
+                f'INSERT into {target}({", ".join(columns)}) VALUES({"?, " * (len(columns) - 1)}?)', converted
+            )
+            await self.connection.commit()
+            last_rowid = rows[-1][0]
+            logging.info(f"Migrated {source} up to rowid {last_rowid}")
+
+    async def _load_recent_partials(self) -> None:
+        cursor = await self.connection.execute(
+            (
+                "SELECT launcher_id, timestamp, difficulty from ("
+                " SELECT launcher_id, timestamp, difficulty,"
+                " ROW_NUMBER() OVER (PARTITION BY launcher_id ORDER BY timestamp DESC) AS row_number from partial"
+                ") WHERE row_number<=? ORDER BY launcher_id, timestamp"
+            ),
+            (self.recent_partials_size,),
+        )
+        for launcher_id, timestamp, difficulty in await cursor.fetchall():
+            self._add_recent_partial(bytes32(launcher_id), timestamp, difficulty)
+        await cursor.close()
+
+    def _add_recent_partial(self, launcher_id: bytes32, timestamp: uint64, difficulty: uint64) -> None:
+        recent_partials: Optional[RecentPartials] = self.recent_partials.get(launcher_id)
+        if recent_partials is None:
+            recent_partials = RecentPartials(self.recent_partials_size)
+            self.recent_partials[launcher_id] = recent_partials
+        recent_partials.add(timestamp, difficulty)
+
+    async def close(self) -> None:
+        self.flush_partials_task.cancel()
+        await self.flush_partials()
+        if self.read_connections is not None:
+            while not self.read_connections.empty():
+                await self.read_connections.get_nowait().close()
+        await self.connection.close()
+
+    @contextlib.asynccontextmanager
+    async def _transaction(self) -> AsyncIterator[None]:
+        """
+        Commits what the block executed on the writer connection, or rolls it back if the block raises (or is
+        cancelled), so that nothing is left for the next writer to commit. The caller holds writer_lock.
+        """
+        try:
+            yield
+            await self.connection.commit()
+        except BaseException:
+            await self.connection.rollback()
+            raise
+
+    @contextlib.asynccontextmanager
+    async def _write(self) -> AsyncIterator[None]:
+        """
+        One transaction on the writer connection, holding writer_lock.
+        """
+        async with self.writer_lock:
+            async with self._transaction():
+                yield
+
+    async def _read(self, sql: str, parameters=()) -> List:
+        """
+        Runs a SELECT on one of the read-only connections (or on the writer if there are none) and returns all rows.
+        """
+        if self.read_connections is None:
+            cursor = await self.connection.execute(sql, parameters)
+            rows = await cursor.fetchall()
+            await cursor.close()
+            return rows
+
+        connection = await self.read_connections.get()
+        try:
+            cursor = await connection.execute(sql, parameters)
+            rows = await cursor.fetchall()
+            await cursor.close()
+            return rows
+        finally:
+            self.read_connections.put_nowait(connection)
+
+    async def _read_unflushed(self, sql: str, parameters=()) -> List:
+        """
+        Same as _read, for rows that the buffered and in-flight partials are then added to. A read racing a commit
+        may or may not see the committed batch, so it is done again. Without read connections the read waits for
+        the flush, since the writer connection sees the uncommitted rows.
+        """
+        if self.read_connections is None:
+            async with self.writer_lock:
+                return await self._read(sql, parameters)
+        while True:
+            flushes = self.flushes
+            rows = await self._read(sql, parameters)
+            if flushes == self.flushes:
+                return rows
+
+    def _get_unflushed_points(self, launcher_id: bytes32) -> int:
+        return self.pending_points.get(launcher_id, 0) + self.flushing_points.get(launcher_id, 0)
+
+    def _get_unflushed_partials(self, launcher_id: bytes32) -> List[Tuple[bytes32, uint64, uint64]]:
+        return [partial for partial in self.flushing_partials + self.pending_partials if partial[0] == launcher_id]
+
+    async def flush_partials_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.partial_flush_interval)
+                await self.flush_partials()
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                logging.error(f"Unexpected error flushing partials: {e}")
 
     @staticmethod
     def _row_to_farmer_record(row) -> FarmerRecord:
         return FarmerRecord(
-            bytes.fromhex(row[0]),
-            bytes.fromhex(row[1]),
+            bytes32(row[0]),
+            bytes32(row[1]),
             row[2],
-            bytes.fromhex(row[3]),
-            G1Element.from_bytes(bytes.fromhex(row[4])),
+            bytes32(row[3]),
+            g1_element_cache.from_bytes(row[4]),
             CoinSolution.from_bytes(row[5]),
             PoolState.from_bytes(row[6]),
             row[7],
@@ -86,125 +450,373 @@ class PoolStore:
             True if row[10] == 1 else False,
         )
 
+    def _update_cached_farmer_record(self, launcher_id: bytes32, **changes) -> None:
+        self.farmer_record_generation += 1
+        cached: Optional[FarmerRecord] = self.farmer_record_cache.get(launcher_id)
+        if cached is not None:
+            self.farmer_record_cache.put(launcher_id, dataclasses.replace(cached, **changes))
+        hot_state: Optional[FarmerHotState] = self.farmer_hot_state_cache.get(launcher_id)
+        hot_changes = {field: value for field, value in changes.items() if field in HOT_STATE_FIELDS}
+        if hot_state is not None and len(hot_changes) > 0:
+            # Cached entries are shared with callers, so they are replaced rather than changed
+            self.farmer_hot_state_cache.put(launcher_id, dataclasses.replace(hot_state, **hot_changes))
+
+    def get_farmer_record_cache_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.farmer_record_cache_hits,
+            "misses": self.farmer_record_cache_misses,
+            "size": len(self.farmer_record_cache.cache),
+            "hot_state_size": len(self.farmer_hot_state_cache.cache),
+            "capacity": self.farmer_record_cache.capacity,
+        }
+
     async def add_farmer_record(self, farmer_record: FarmerRecord):
-        cursor = await self.connection.execute(
-            f"INSERT OR REPLACE INTO farmer VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                farmer_record.launcher_id.hex(),
-                farmer_record.p2_singleton_puzzle_hash.hex(),
-                farmer_record.delay_time,
-                farmer_record.delay_puzzle_hash.hex(),
-                bytes(farmer_record.authentication_public_key).hex(),
-                bytes(farmer_record.singleton_tip),
-                bytes(farmer_record.singleton_tip_state),
-                farmer_record.points,
-                farmer_record.difficulty,
-                farmer_record.payout_instructions,
-                int(farmer_record.is_pool_member),
-            ),
-        )
-        await cursor.close()
-        await self.connection.commit()
+        """
+        Inserts or replaces the farmer. Points are only ever changed through add_partial, so farmer_record.points is
+        ignored.
+        """
+        self.farmer_record_generation += 1
+        async with self._write():
+            cursor = await self.connection.execute(
+                f'INSERT OR REPLACE INTO farmer({", ".join(FARMER_COLUMNS)}) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    farmer_record.launcher_id,
+                    farmer_record.p2_singleton_puzzle_hash,
+                    farmer_record.delay_time,
+                    farmer_record.delay_puzzle_hash,
+                    bytes(farmer_record.authentication_public_key),
+                    bytes(farmer_record.singleton_tip),
+                    bytes(farmer_record.singleton_tip_state),
+                    farmer_record.difficulty,
+                    farmer_record.payout_instructions,
+                    int(farmer_record.is_pool_member),
+                ),
+            )
+            await cursor.close()
+        cached: Optional[FarmerRecord] = self.farmer_record_cache.get(farmer_record.launcher_id)
+        if cached is not None:
+            # The points are not written here, the cached ones are still right
+            self.farmer_record_cache.put(
+                farmer_record.launcher_id, dataclasses.replace(farmer_record, points=cached.points)
+            )
+        self.farmer_hot_state_cache.put(farmer_record.launcher_id, FarmerHotState.from_farmer_record(farmer_record))
 
     async def get_farmer_record(self, launcher_id: bytes32) -> Optional[FarmerRecord]:
-        # TODO(pool): use cache
-        cursor = await self.connection.execute(
-            "SELECT * from farmer where launcher_id=?",
-            (launcher_id.hex(),),
+        cached: Optional[FarmerRecord] = self.farmer_record_cache.get(launcher_id)
+        if cached is not None:
+            self.farmer_record_cache_hits += 1
+            return cached
+        self.farmer_record_cache_misses += 1
+
+        generation = self.farmer_record_generation
+        rows = await self._read_unflushed(
+            f"{SELECT_FARMER_RECORD} WHERE farmer.launcher_id=?", (self.points_epoch, launcher_id)
         )
-        row = await cursor.fetchone()
-        if row is None:
+        if len(rows) == 0:
             return None
-        return self._row_to_farmer_record(row)
+        farmer_record = self._row_to_farmer_record(rows[0])
+        unflushed_points = self._get_unflushed_points(launcher_id)
+        if unflushed_points > 0:
+            farmer_record = dataclasses.replace(farmer_record, points=uint64(farmer_record.points + unflushed_points))
+        if generation == self.farmer_record_generation:
+            self.farmer_record_cache.put(launcher_id, farmer_record)
+        return farmer_record
 
-    async def update_difficulty(self, launcher_id: bytes32, difficulty: uint64):
-        cursor = await self.connection.execute(
-            f"UPDATE farmer SET difficulty=? WHERE launcher_id=?", (difficulty, launcher_id.hex())
-        )
-        await cursor.close()
-        await self.connection.commit()
+    async def get_farmer_hot_state(self, launcher_id: bytes32) -> Optional[FarmerHotState]:
+        hot_state: Optional[FarmerHotState] = self.farmer_hot_state_cache.get(launcher_id)
+        if hot_state is None:
+            cached: Optional[FarmerRecord] = self.farmer_record_cache.get(launcher_id)
+            if cached is not None:
+                hot_state = FarmerHotState.from_farmer_record(cached)
+                self.farmer_hot_state_cache.put(launcher_id, hot_state)
+        if hot_state is not None:
+            self.farmer_record_cache_hits += 1
+            return hot_state
+        self.farmer_record_cache_misses += 1
 
-    async def update_singleton(
-        self,
-        launcher_id: bytes32,
-        singleton_tip: CoinSolution,
-        singleton_tip_state: PoolState,
-        is_pool_member: bool,
-    ):
-        if is_pool_member:
-            entry = (bytes(singleton_tip), bytes(singleton_tip_state), 1, launcher_id.hex())
-        else:
-            entry = (bytes(singleton_tip), bytes(singleton_tip_state), 0, launcher_id.hex())
-        cursor = await self.connection.execute(
-            f"UPDATE farmer SET singleton_tip=?, singleton_tip_state=?, is_pool_member=? WHERE launcher_id=?",
-            entry,
+        generation = self.farmer_record_generation
+        rows = await self._read(
+            (
+                "SELECT launcher_id, p2_singleton_puzzle_hash, authentication_public_key, difficulty, is_pool_member "
+                "from farmer where launcher_id=?"
+            ),
+            (launcher_id,),
         )
-        await cursor.close()
-        await self.connection.commit()
+        if len(rows) == 0:
+            return None
+        row = rows[0]
+        hot_state = FarmerHotState(
+            bytes32(row[0]), bytes32(row[1]), g1_element_cache.from_bytes(row[2]), uint64(row[3]), row[4] == 1
+        )
+        if generation == self.farmer_record_generation:
+            self.farmer_hot_state_cache.put(launcher_id, hot_state)
+        return hot_state
+
+    async def update_difficulty(self, launcher_id: bytes32, difficulty: uint64):
+        async with self._write():
+            cursor = await self.connection.execute(
+                f"UPDATE farmer SET difficulty=? WHERE launcher_id=?", (difficulty, launcher_id)
+            )
+            await cursor.close()
+        self._update_cached_farmer_record(launcher_id, difficulty=difficulty)
+
+    async def update_singletons(self, updates: List[Tuple[bytes32, CoinSolution, PoolState, bool]]):
+        """
+        Updates the singleton tip, its state and the pool membership of many farmers, in one transaction.
+        """
+        if len(updates) == 0:
+            return
+        async with self._write():
+            await self.connection.executemany(
+                f"UPDATE farmer SET singleton_tip=?, singleton_tip_state=?, is_pool_member=? WHERE launcher_id=?",
+                [
+                    (bytes(singleton_tip), bytes(singleton_tip_state), 1 if is_pool_member else 0, launcher_id)
+                    for launcher_id, singleton_tip, singleton_tip_state, is_pool_member in updates
+                ],
+            )
+        for launcher_id, singleton_tip, singleton_tip_state, is_pool_member in updates:
+            self._update_cached_farmer_record(
+                launcher_id,
+                singleton_tip=singleton_tip,
+                singleton_tip_state=singleton_tip_state,
+                is_pool_member=is_pool_member,
+            )
+
+    async def get_launcher_ids(self) -> List[bytes32]:
+        rows = await self._read("SELECT launcher_id from farmer")
+        return [bytes32(row[0]) for row in rows]
 
     async def get_pay_to_singleton_phs(self) -> Set[bytes32]:
-        cursor = await self.connection.execute("SELECT p2_singleton_puzzle_hash from farmer")
-        rows = await cursor.fetchall()
+        rows = await self._read("SELECT p2_singleton_puzzle_hash from farmer")
 
         all_phs: Set[bytes32] = set()
         for row in rows:
-            all_phs.add(bytes32(bytes.fromhex(row[0])))
+            all_phs.add(bytes32(row[0]))
         return all_phs
 
     async def get_farmer_records_for_p2_singleton_phs(self, puzzle_hashes: Set[bytes32]) -> List[FarmerRecord]:
         if len(puzzle_hashes) == 0:
             return []
-        puzzle_hashes_db = tuple([ph.hex() for ph in list(puzzle_hashes)])
-        cursor = await self.connection.execute(
-            f'SELECT * from farmer WHERE p2_singleton_puzzle_hash in ({"?," * (len(puzzle_hashes_db) - 1)}?) ',
-            puzzle_hashes_db,
+        puzzle_hashes_db = tuple(puzzle_hashes)
+        rows = await self._read(
+            f'{SELECT_FARMER_RECORD} WHERE p2_singleton_puzzle_hash in ({"?," * (len(puzzle_hashes_db) - 1)}?) ',
+            (self.points_epoch,) + puzzle_hashes_db,
         )
-        rows = await cursor.fetchall()
         return [self._row_to_farmer_record(row) for row in rows]
 
-    async def get_farmer_points_and_payout_instructions(self) -> List[Tuple[uint64, bytes]]:
-        cursor = await self.connection.execute(f"SELECT points, payout_instructions from farmer")
-        rows = await cursor.fetchall()
-        accumulated: Dict[bytes32, uint64] = {}
-        for row in rows:
-            points: uint64 = uint64(row[0])
-            ph: bytes32 = bytes32(bytes.fromhex(row[1]))
-            if ph in accumulated:
-                accumulated[ph] += points
-            else:
-                accumulated[ph] = points
-
-        ret: List[Tuple[uint64, bytes32]] = []
-        for ph, total_points in accumulated.items():
-            ret.append((total_points, ph))
-        return ret
+    async def get_reward_scan_height(self) -> Optional[uint32]:
+        rows = await self._read("SELECT MAX(height) from reward_scan")
+        return None if rows[0][0] is None else uint32(rows[0][0])
 
-    async def clear_farmer_points(self) -> None:
-        cursor = await self.connection.execute(f"UPDATE farmer set points=0")
-        await cursor.close()
-        await self.connection.commit()
+    async def set_reward_scan_height(self, height: uint32) -> None:
+        async with self._write():
+            await self.connection.execute("DELETE from reward_scan")
+            await self.connection.execute("INSERT into reward_scan VALUES(?)", (height,))
 
-    async def add_partial(self, launcher_id: bytes32, timestamp: uint64, difficulty: uint64):
+    async def close_points_epoch(self) -> int:
+        """
+        Closes the current points epoch, partials confirmed from now on count towards the next one. This is a single
+        insert, so partial ingestion is not blocked by payouts. If an earlier epoch was closed but never marked as
+        paid (for example the pool stopped during a payout), that epoch is returned instead and the current epoch
+        stays open.
+        :return: the closed epoch whose points should be paid out
+        """
         cursor = await self.connection.execute(
-            "INSERT into partial VALUES(?, ?, ?)",
-            (launcher_id.hex(), timestamp, difficulty),
+            "SELECT MIN(epoch) from points_epoch WHERE paid=0 AND epoch<?", (self.points_epoch,)
         )
+        unpaid_epoch = (await cursor.fetchone())[0]
         await cursor.close()
-        cursor = await self.connection.execute(f"SELECT points from farmer where launcher_id=?", (launcher_id.hex(),))
-        row = await cursor.fetchone()
-        points = row[0]
-        await cursor.close()
+        if unpaid_epoch is not None:
+            return unpaid_epoch
+
+        # Waits for a running flush, so that no points are written to the closed epoch after this returns
+        async with self.writer_lock:
+            async with self._transaction():
+                await self.connection.execute("INSERT into points_epoch VALUES(?, 0)", (self.points_epoch + 1,))
+            closed_epoch = self.points_epoch
+            self.points_epoch += 1
+
+            # Buffered partials will be written to the new epoch
+            self.farmer_record_generation += 1
+            for launcher_id, cached in list(self.farmer_record_cache.cache.items()):
+                points = uint64(self.pending_points.get(launcher_id, 0))
+                self.farmer_record_cache.cache[launcher_id] = dataclasses.replace(cached, points=points)
+        return closed_epoch
+
+    async def get_points_epoch_total(self, epoch: int) -> uint64:
+        # The epoch is closed, so this can run on a read connection instead of keeping the writer busy
+        rows = await self._read("SELECT SUM(points) from farmer_points WHERE epoch=?", (epoch,))
+        return uint64(0 if rows[0][0] is None else rows[0][0])
+
+    async def get_points_epoch_payouts(
+        self, epoch: int, chunk_size: int
+    ) -> AsyncIterator[List[Tuple[uint64, bytes32]]]:
+        """
+        Streams the points of a closed epoch summed per payout instructions, as lists of up to chunk_size
+        (points, payout puzzle hash) pairs.
+        """
+        # Walks the farmers in payout_instructions order (CROSS JOIN keeps farmer as the outer table), so the groups
+        # come out one by one. Driven by farmer_points, the whole epoch would be sorted before the first chunk, which
+        # keeps the writer connection busy for seconds with many farmers.
         cursor = await self.connection.execute(
-            f"UPDATE farmer set points=? where launcher_id=?", (points + difficulty, launcher_id.hex())
+            (
+                "SELECT SUM(farmer_points.points), farmer.payout_instructions from farmer"
+                " CROSS JOIN farmer_points ON farmer_points.epoch=? AND farmer_points.launcher_id=farmer.launcher_id"
+                " WHERE farmer_points.points>0 GROUP BY farmer.payout_instructions"
+            ),
+            (epoch,),
         )
+        while True:
+            rows = await cursor.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            yield [(uint64(points), bytes32(bytes.fromhex(ph))) for points, ph in rows]
         await cursor.close()
-        await self.connection.commit()
+
+    async def mark_points_epoch_paid(self, epoch: int, batch_size: int = 10000) -> None:
+        """
+        Marks the epoch as paid, then deletes its points batch_size rows per transaction, so that flushes do not wait
+        for the whole delete. The epochs before it are all paid, points left over from an interrupted delete are
+        deleted here too.
+        """
+        async with self._write():
+            await self.connection.execute("UPDATE points_epoch SET paid=1 WHERE epoch=?", (epoch,))
+        while True:
+            async with self._write():
+                cursor = await self.connection.execute(
+                    "DELETE from farmer_points WHERE rowid in (SELECT rowid from farmer_points WHERE epoch<=? LIMIT ?)",
+                    (epoch, batch_size),
+                )
+                deleted = cursor.rowcount
+                await cursor.close()
+            if deleted < batch_size:
+                return
+
+    async def add_partial(self, launcher_id: bytes32, timestamp: uint64, difficulty: uint64):
+        self.pending_partials.append((launcher_id, timestamp, difficulty))
+        self._add_recent_partial(launcher_id, timestamp, difficulty)
+        self.pending_points[launcher_id] = self.pending_points.get(launcher_id, 0) + difficulty
+        cached: Optional[FarmerRecord] = self.farmer_record_cache.get(launcher_id)
+        if cached is not None:
+            self._update_cached_farmer_record(launcher_id, points=uint64(cached.points + difficulty))
+        if len(self.pending_partials) >= self.partial_batch_size:
+            await self.flush_partials()
+
+    async def flush_partials(self) -> None:
+        """
+        Writes all buffered partials and their point increments in a single transaction.
+        """
+        async with self.writer_lock:
+            await self._flush_partials()
+
+    async def _flush_partials(self) -> None:
+        if len(self.pending_partials) == 0:
+            return
+        partials, self.pending_partials = self.pending_partials, []
+        points, self.pending_points = self.pending_points, {}
+        self.flushing_partials, self.flushing_points = partials, points
+        self.farmer_record_generation += 1
+
+        try:
+            async with self._transaction():
+                await self.connection.executemany("INSERT into partial VALUES(?, ?, ?)", partials)
+                await self.connection.executemany(
+                    (
+                        "INSERT into farmer_points VALUES(?, ?, ?) "
+                        "ON CONFLICT(epoch, launcher_id) DO UPDATE SET points=points+excluded.points"
+                    ),
+                    [(self.points_epoch, launcher_id, increment) for launcher_id, increment in points.items()],
+                )
+            self.flushes += 1
+        except BaseException:
+            # Put the batch back so that it is retried with the next flush
+            self.pending_partials = partials + self.pending_partials
+            for launcher_id, increment in points.items():
+                self.pending_points[launcher_id] = self.pending_points.get(launcher_id, 0) + increment
+            raise
+        finally:
+            self.flushing_partials, self.flushing_points = [], {}
+            self.farmer_record_generation += 1
 
     async def get_recent_partials(self, launcher_id: bytes32, count: int) -> List[Tuple[uint64, uint64]]:
-        cursor = await self.connection.execute(
+        if count <= self.recent_partials_size:
+            recent_partials: Optional[RecentPartials] = self.recent_partials.get(launcher_id)
+            return [] if recent_partials is None else recent_partials.get(count)
+
+        rows = await self._read_unflushed(
             "SELECT timestamp, difficulty from partial WHERE launcher_id=? ORDER BY timestamp DESC LIMIT ?",
-            (launcher_id.hex(), count),
+            (launcher_id, count),
         )
-        rows = await cursor.fetchall()
         ret: List[Tuple[uint64, uint64]] = [(uint64(timestamp), uint64(difficulty)) for timestamp, difficulty in rows]
+        unflushed = self._get_unflushed_partials(launcher_id)
+        if len(unflushed) > 0:
+            ret += [(uint64(timestamp), uint64(difficulty)) for _, timestamp, difficulty in unflushed]
+            ret = sorted(ret, key=lambda partial: partial[0], reverse=True)[:count]
         return ret
+
+    async def compact_partials(self, before_timestamp: uint64, batch_size: int) -> int:
+        """
+        Moves all raw partials older than before_timestamp into the hourly rollup table, batch_size rows per
+        transaction, so that other writes can interleave with a large compaction.
+        :return: the number of raw partials that were compacted
+        """
+        compacted = 0
+        while True:
+            batch_compacted = await self._compact_partials_batch(before_timestamp, batch_size)
+            if batch_compacted == 0:
+                return compacted
+            compacted += batch_compacted
+
+    async def _compact_partials_batch(self, before_timestamp: uint64, batch_size: int) -> int:
+        async with self._write():
+            cursor = await self.connection.execute(
+                "SELECT rowid from partial WHERE timestamp<? ORDER BY timestamp LIMIT ?",
+                (before_timestamp, batch_size),
+            )
+            rowids = [row[0] for row in await cursor.fetchall()]
+            await cursor.close()
+            if len(rowids) == 0:
+                return 0
+
+            rowids_db = f'({"?," * (len(rowids) - 1)}?)'
+            await self.connection.execute(
+                (
+                    "INSERT INTO partial_hourly "
+                    "SELECT launcher_id, (timestamp / 3600) * 3600, COUNT(*), SUM(difficulty) "
+                    f"from partial WHERE rowid in {rowids_db} GROUP BY 1, 2 "
+                    "ON CONFLICT(launcher_id, hour) "
+                    "DO UPDATE SET count=count+excluded.count, difficulty=difficulty+excluded.difficulty"
+                ),
+                rowids,
+            )
+            await self.connection.execute(f"DELETE from partial WHERE rowid in {rowids_db}", rowids)
+        return len(rowids)
+
+    async def get_hourly_partials(
+        self, launcher_id: bytes32, start_timestamp: uint64
+    ) -> List[Tuple[uint64, uint64, uint64]]:
+        """
+        :return: (hour, number of partials, summed difficulty) for every hour since start_timestamp in which the
+        farmer submitted partials, combining compacted rollups with raw partials that are still in the database.
+        """
+        start_hour = start_timestamp - start_timestamp % 3600
+        rows = await self._read_unflushed(
+            (
+                "SELECT hour, SUM(count), SUM(difficulty) from ("
+                " SELECT hour, count, difficulty from partial_hourly WHERE launcher_id=? AND hour>=?"
+                " UNION ALL"
+                " SELECT (timestamp / 3600) * 3600, COUNT(*), SUM(difficulty) from partial"
+                " WHERE launcher_id=? AND timestamp>=? GROUP BY 1"
+                ") GROUP BY hour ORDER BY hour"
+            ),
+            (launcher_id, start_hour, launcher_id, start_hour),
+        )
+        hours: Dict[int, List[int]] = {hour: [count, difficulty] for hour, count, difficulty in rows}
+        for _, timestamp, difficulty in self._get_unflushed_partials(launcher_id):
+            if timestamp >= start_hour:
+                totals = hours.setdefault(timestamp - timestamp % 3600, [0, 0])
+                totals[0] += 1
+                totals[1] += difficulty
+        return [
+            (uint64(hour), uint64(count), uint64(difficulty)) for hour, (count, difficulty) in sorted(hours.items())
+        ]
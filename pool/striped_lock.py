@@ -0,0 +1,34 @@
+import asyncio
+from typing import Iterable, List, Optional
+
+
+class StripedLock:
+    """
+    A fixed number of locks, one of which is picked by key. Operations on the same key are serialized, while
+    operations on different keys almost never wait for each other. Keys must be uniformly distributed bytes, like
+    launcher ids.
+    """
+
+    def __init__(self, stripes: int = 1024):
+        # Created on first use, so that they belong to the running event loop
+        self.locks: List[Optional[asyncio.Lock]] = [None] * stripes
+
+    def __call__(self, key: bytes) -> asyncio.Lock:
+        return self._get(self._index(key))
+
+    def ordered(self, keys: Iterable[bytes]) -> List[asyncio.Lock]:
+        """
+        :return: the locks of all the keys, each once, in a fixed order. Callers that acquire them in this order do
+        not deadlock with each other.
+        """
+        return [self._get(index) for index in sorted({self._index(key) for key in keys})]
+
+    def _index(self, key: bytes) -> int:
+        return int.from_bytes(key[:8], "big") % len(self.locks)
+
+    def _get(self, index: int) -> asyncio.Lock:
+        lock = self.locks[index]
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[index] = lock
+        return lock
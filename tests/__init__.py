@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pool modules import each other by module name, as when pool/pool_server.py is run
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pool"))
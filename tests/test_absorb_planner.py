@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+from typing import Dict, List
+
+from chia.consensus.condition_costs import ConditionCost
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program, SerializedProgram
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_solution import CoinSolution
+from chia.types.condition_opcodes import ConditionOpcode
+from chia.util.ints import uint64
+
+from absorb_planner import SPENDS_PER_ABSORB, estimate_cost, pack_absorb_bundles, plan_absorb_bundles
+
+COST_PER_BYTE = 12000
+
+
+def make_spend(i: int, create_coins: int = 1) -> CoinSolution:
+    """
+    A spend whose puzzle quotes create_coins CREATE_COIN conditions
+    """
+    puzzle_hash = bytes32(bytes([0xEE]) * 32)
+    conditions = [[ConditionOpcode.CREATE_COIN.value, puzzle_hash, amount] for amount in range(1, create_coins + 1)]
+    return CoinSolution(
+        Coin(bytes32(i.to_bytes(32, "big")), puzzle_hash, uint64(1)),
+        SerializedProgram.from_program(Program.to((1, conditions))),
+        SerializedProgram.from_program(Program.to(0)),
+    )
+
+
+def make_absorb_spends(absorbs: Dict[bytes32, int]) -> Dict[bytes32, List[CoinSolution]]:
+    return {
+        launcher_id: [make_spend(i) for i in range(count * SPENDS_PER_ABSORB)] for launcher_id, count in absorbs.items()
+    }
+
+
+class TestAbsorbPlanner(unittest.TestCase):
+    def test_estimate_cost(self):
+        one_coin, two_coins = make_spend(1, 1), make_spend(1, 2)
+        # Running the puzzle costs as much, they only differ by a created coin and their size
+        assert estimate_cost(two_coins, COST_PER_BYTE) - estimate_cost(one_coin, COST_PER_BYTE) == (
+            ConditionCost.CREATE_COIN.value + (len(bytes(two_coins)) - len(bytes(one_coin))) * COST_PER_BYTE
+        )
+
+    def test_pack(self):
+        launcher_ids = [bytes32(bytes([i]) * 32) for i in range(7)]
+        a, b, c, d, e, f, g = launcher_ids
+        absorb_costs = {a: [4, 4], b: [6], c: [3, 3, 3], d: [11], e: [2], f: [1], g: [5, 4, 3]}
+        absorb_spends = make_absorb_spends(
+            {launcher_id: len(absorb_costs[launcher_id]) for launcher_id in launcher_ids}
+        )
+
+        bundles = pack_absorb_bundles(absorb_spends, absorb_costs, 10)
+        # First fit decreasing: c (9), g (9), a (8) and b (6) each open a bundle, e (2) fits with a, and f (1) with c.
+        # d does not fit in any bundle, and only the first two rewards of g fit in one.
+        assert [sorted(bundle.keys()) for bundle in bundles] == [[c, f], [g], [a, e], [b]]
+        for bundle in bundles:
+            assert (
+                sum(
+                    sum(absorb_costs[launcher_id][: len(group) // SPENDS_PER_ABSORB])
+                    for launcher_id, group in bundle.items()
+                )
+                <= 10
+            )
+            for launcher_id, group in bundle.items():
+                if launcher_id == g:
+                    assert group == absorb_spends[g][: 2 * SPENDS_PER_ABSORB]
+                else:
+                    assert group == absorb_spends[launcher_id]
+
+    def test_plan(self):
+        async def run():
+            a, b = bytes32(bytes([1]) * 32), bytes32(bytes([2]) * 32)
+            absorb_spends = make_absorb_spends({a: 1, b: 1})
+            absorb_cost = sum(estimate_cost(coin_solution, COST_PER_BYTE) for coin_solution in absorb_spends[a])
+
+            assert await plan_absorb_bundles(absorb_spends, 2 * absorb_cost, COST_PER_BYTE) == [absorb_spends]
+            assert await plan_absorb_bundles(absorb_spends, 2 * absorb_cost - 1, COST_PER_BYTE) == [
+                {a: absorb_spends[a]},
+                {b: absorb_spends[b]},
+            ]
+            assert await plan_absorb_bundles(absorb_spends, absorb_cost - 1, COST_PER_BYTE) == []
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
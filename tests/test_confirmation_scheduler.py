@@ -0,0 +1,46 @@
+import asyncio
+import time
+import unittest
+
+from pool.confirmation_scheduler import ConfirmationScheduler
+
+
+class TestConfirmationScheduler(unittest.TestCase):
+    def test_pop_due(self):
+        scheduler = ConfirmationScheduler(10)
+        for due_time in [105, 101, 120, 99, 111, 100]:
+            scheduler.add(due_time, due_time)
+        assert len(scheduler) == 6
+        assert scheduler.pop_due(99) == []
+        assert sorted(scheduler.pop_due(100)) == [99, 100]
+        assert scheduler.pop_due(109) == []
+        assert sorted(scheduler.pop_due(110)) == [101, 105]
+        assert sorted(scheduler.pop_due(1000)) == [111, 120]
+        assert len(scheduler) == 0
+
+    def test_next_batch(self):
+        async def run():
+            scheduler = ConfirmationScheduler(0.1)
+            now = time.time()
+            for i in range(1000):
+                scheduler.add(now + 0.15, i)
+            batch = await scheduler.next_batch()
+            assert time.time() >= now + 0.15
+            assert sorted(batch) == list(range(1000))
+
+            # An item added while waiting, that is due before the earliest bucket
+            scheduler.add(time.time() + 10, "late")
+
+            async def add_later():
+                await asyncio.sleep(0.05)
+                scheduler.add(time.time(), "early")
+
+            asyncio.create_task(add_later())
+            assert await asyncio.wait_for(scheduler.next_batch(), 1) == ["early"]
+            assert len(scheduler) == 1
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
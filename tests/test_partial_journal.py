@@ -0,0 +1,113 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from pool.partial_journal import PartialJournal
+
+
+class TestPartialJournal(unittest.TestCase):
+    def test_replays_unconfirmed(self):
+        async def run():
+            with tempfile.TemporaryDirectory() as directory:
+                journal = PartialJournal(directory, 0.01)
+                assert journal.open() == []
+                seqs = [journal.append(b"partial %d" % i) for i in range(10)]
+                await journal.sync()
+                for seq in seqs[:5]:
+                    journal.confirm(seq)
+                await journal.sync()
+                journal.confirm(seqs[5])
+                # Not synced, like a crash right after the confirmation
+                journal.file.close()
+
+                journal = PartialJournal(directory, 0.01)
+                replayed = journal.open()
+                assert [data for _, data in replayed] == [b"partial %d" % i for i in range(5, 10)]
+                assert [seq for seq, _ in replayed] == seqs[5:]
+                journal.confirm(replayed[0][0])
+                await journal.close()
+
+                journal = PartialJournal(directory, 0.01)
+                assert [data for _, data in journal.open()] == [b"partial %d" % i for i in range(6, 10)]
+                await journal.close()
+
+        asyncio.run(run())
+
+    def test_crash_while_replaying(self):
+        async def run():
+            with tempfile.TemporaryDirectory() as directory:
+                journal = PartialJournal(directory, 0.01)
+                journal.open()
+                seqs = [journal.append(b"partial %d" % i) for i in range(3)]
+                journal.confirm(seqs[0])
+                await journal.close()
+
+                # Crash after the new segment is written, before the old one is deleted
+                remove = os.remove
+                os.remove = lambda path: None
+                try:
+                    journal = PartialJournal(directory, 0.01)
+                    journal.open()
+                    journal.file.close()
+                finally:
+                    os.remove = remove
+                assert len(os.listdir(directory)) == 2
+
+                journal = PartialJournal(directory, 0.01)
+                assert journal.open() == [(seqs[1], b"partial 1"), (seqs[2], b"partial 2")]
+                assert journal.append(b"partial 3") > seqs[2]
+                await journal.close()
+
+        asyncio.run(run())
+
+    def test_ignores_partially_written_record(self):
+        async def run():
+            with tempfile.TemporaryDirectory() as directory:
+                journal = PartialJournal(directory, 0.01)
+                journal.open()
+                journal.append(b"first")
+                journal.append(b"second")
+                await journal.close()
+                path = os.path.join(directory, journal.segments[-1])
+                with open(path, "r+b") as f:
+                    f.truncate(os.path.getsize(path) - 2)
+
+                journal = PartialJournal(directory, 0.01)
+                assert [data for _, data in journal.open()] == [b"first"]
+                await journal.close()
+
+        asyncio.run(run())
+
+    def test_deletes_confirmed_segments(self):
+        async def run():
+            with tempfile.TemporaryDirectory() as directory:
+                journal = PartialJournal(directory, 0.01, segment_seconds=0)
+                journal.open()
+                seqs = []
+                for i in range(5):
+                    seqs.append(journal.append(b"partial %d" % i))
+                    await journal.sync()
+                assert len(os.listdir(directory)) == 6
+                # Every sync starts a new segment, and only a prefix of segments can be deleted
+                journal.confirm(seqs[1])
+                await journal.sync()
+                assert len(os.listdir(directory)) == 7
+                journal.confirm(seqs[0])
+                await journal.sync()
+                assert len(os.listdir(directory)) == 6
+                for seq in seqs[2:]:
+                    journal.confirm(seq)
+                await journal.sync()
+                assert len(os.listdir(directory)) == 1
+                await journal.close()
+
+                journal = PartialJournal(directory, 0.01)
+                assert journal.open() == []
+                await journal.close()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from chia.consensus.coinbase import pool_parent_id
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.util.ints import uint32
+
+from pool_parent_index import PoolParentIndex
+
+GENESIS_CHALLENGE = bytes32(bytes([0xCC]) * 32)
+
+
+def parent_id(height: int) -> bytes32:
+    return pool_parent_id(uint32(height), GENESIS_CHALLENGE)
+
+
+class TestPoolParentIndex(unittest.TestCase):
+    def test_window(self):
+        index = PoolParentIndex(GENESIS_CHALLENGE, 10)
+        index.update(uint32(4))
+        assert len(index) == 5
+        assert [index.get_height(parent_id(height)) for height in range(6)] == [0, 1, 2, 3, 4, None]
+
+        # The window moves with the peak, the heights that leave it are dropped
+        index.update(uint32(14))
+        assert len(index) == 10
+        assert (index.start_height, index.end_height) == (5, 15)
+        assert index.get_height(parent_id(4)) is None
+        assert index.get_height(parent_id(5)) == 5
+        assert index.get_height(parent_id(14)) == 14
+        assert index.get_height(parent_id(15)) is None
+
+        # A peak past the whole window starts over
+        index.update(uint32(100))
+        assert len(index) == 10
+        assert index.get_height(parent_id(14)) is None
+        assert [index.get_height(parent_id(height)) for height in range(91, 101)] == list(range(91, 101))
+
+    def test_reorg(self):
+        index = PoolParentIndex(GENESIS_CHALLENGE, 10)
+        index.update(uint32(20))
+
+        # A reorg to a lower peak keeps the higher heights, whose parent ids do not change
+        index.update(uint32(17))
+        assert (index.start_height, index.end_height) == (11, 21)
+        assert index.get_height(parent_id(20)) == 20
+        assert len(index) == 10
+
+        # Only the new heights are added once the chain is past the old peak again
+        index.update(uint32(22))
+        assert (index.start_height, index.end_height) == (13, 23)
+        assert len(index) == len(index.parent_ids) == 10
+        assert index.get_height(parent_id(12)) is None
+        assert [index.get_height(parent_id(height)) for height in range(13, 23)] == list(range(13, 23))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import random
+import time
+import unittest
+
+from chia.util.ints import uint64
+
+from pool.difficulty_adjustment import get_new_difficulty
+from pool.recent_partials import RecentPartials
+
+
+def sql_recent_partials(partials, count):
+    # Equivalent of "SELECT timestamp, difficulty from partial ORDER BY timestamp DESC LIMIT count"
+    return sorted(partials, key=lambda partial: partial[0], reverse=True)[:count]
+
+
+class TestRecentPartials(unittest.TestCase):
+    def test_empty(self):
+        assert RecentPartials(10).get(10) == []
+
+    def test_not_full(self):
+        recent = RecentPartials(10)
+        for i in range(5):
+            recent.add(100 + i, 20)
+        assert recent.get(10) == [(104, 20), (103, 20), (102, 20), (101, 20), (100, 20)]
+        assert recent.get(2) == [(104, 20), (103, 20)]
+
+    def test_wraps_around(self):
+        recent = RecentPartials(10)
+        partials = []
+        for i in range(37):
+            partials.append((100 + i, i))
+            recent.add(100 + i, i)
+            assert recent.get(10) == sql_recent_partials(partials, 10)
+
+    def test_out_of_order(self):
+        recent = RecentPartials(10)
+        partials = []
+        for timestamp in [100, 105, 103, 110, 90, 111, 104, 120, 119, 130, 131, 101, 132, 133, 125]:
+            partials.append((timestamp, 20))
+            recent.add(timestamp, 20)
+            assert recent.get(10) == sql_recent_partials(partials, 10)
+
+    def test_same_decisions_as_database(self):
+        random.seed(1)
+        num_partials = 300
+        time_target = 24 * 3600
+        recent = RecentPartials(num_partials)
+        partials = []
+        current_time = uint64(time.time()) - 10 * time_target
+        difficulty = uint64(20)
+        for _ in range(5000):
+            current_time = uint64(current_time + random.choice([1, 60, 200, 400, 4000, 12000]))
+            partials.append((current_time, difficulty))
+            recent.add(current_time, difficulty)
+
+            from_ring = get_new_difficulty(
+                recent.get(num_partials), num_partials, time_target, difficulty, current_time, 1
+            )
+            from_database = get_new_difficulty(
+                sql_recent_partials(partials, num_partials), num_partials, time_target, difficulty, current_time, 1
+            )
+            assert from_ring == from_database
+            difficulty = from_ring
+
+
+if __name__ == "__main__":
+    unittest.main()
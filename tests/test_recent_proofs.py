@@ -0,0 +1,42 @@
+import unittest
+
+from pool.recent_proofs import RecentProofs
+
+
+class TestRecentProofs(unittest.TestCase):
+    def test_rejects_duplicates_within_window(self):
+        recent = RecentProofs(100)
+        assert recent.add(b"a", 1000)
+        assert not recent.add(b"a", 1000)
+        assert recent.add(b"b", 1050)
+        assert not recent.add(b"a", 1099)
+        assert not recent.add(b"b", 1149)
+
+    def test_forgets_after_window(self):
+        recent = RecentProofs(100)
+        for i in range(1000):
+            assert recent.add(i.to_bytes(4, "big"), 1000 + i)
+        assert len(recent) <= 111
+        assert not recent.add((999).to_bytes(4, "big"), 2000)
+        assert recent.add((850).to_bytes(4, "big"), 2000)
+        # A long pause drops everything
+        recent.add(b"x", 5000)
+        assert len(recent) == 1
+
+    def test_contains_does_not_add(self):
+        recent = RecentProofs(100)
+        assert not recent.contains(b"a", 1000)
+        assert recent.add(b"a", 1000)
+        assert recent.contains(b"a", 1050)
+        assert not recent.contains(b"a", 1200)
+
+    def test_discard(self):
+        recent = RecentProofs(100)
+        assert recent.add(b"a", 1000)
+        recent.discard(b"a")
+        assert recent.add(b"a", 1001)
+        recent.discard(b"missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import unittest
+from typing import Dict, List, Optional, Set, Tuple
+
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_record import CoinRecord
+from chia.util.ints import uint32, uint64
+
+from reward_scanner import RewardScanner
+
+PUZZLE_HASH_1 = bytes32(bytes([1]) * 32)
+PUZZLE_HASH_2 = bytes32(bytes([2]) * 32)
+
+
+class StubNode:
+    """
+    The coin lookups of a full node, over the coins in coin_records
+    """
+
+    def __init__(self):
+        self.coin_records: Dict[bytes32, CoinRecord] = {}
+        # (number of puzzle hashes, start height) of each get_coin_records_by_puzzle_hashes call
+        self.scans: List[Tuple[int, int]] = []
+
+    def add_coin(self, puzzle_hash: bytes32, height: int) -> Coin:
+        coin = Coin(bytes32(len(self.coin_records).to_bytes(32, "big")), puzzle_hash, uint64(1750000000000))
+        self.coin_records[coin.name()] = CoinRecord(coin, uint32(height), uint32(0), False, True, uint64(0))
+        return coin
+
+    def spend(self, coin: Coin, height: int) -> None:
+        coin_record = self.coin_records[coin.name()]
+        self.coin_records[coin.name()] = CoinRecord(
+            coin, coin_record.confirmed_block_index, uint32(height), True, True, uint64(0)
+        )
+
+    async def get_coin_records_by_puzzle_hashes(
+        self, puzzle_hashes: List[bytes32], include_spent_coins: bool, start_height: Optional[int] = None
+    ) -> List[CoinRecord]:
+        assert not include_spent_coins
+        self.scans.append((len(puzzle_hashes), start_height))
+        return [
+            coin_record
+            for coin_record in self.coin_records.values()
+            if coin_record.coin.puzzle_hash in puzzle_hashes
+            and coin_record.confirmed_block_index >= start_height
+            and not coin_record.spent
+        ]
+
+    async def fetch(self, path: str, request_json: Dict) -> Dict:
+        assert path == "get_coin_records_by_names"
+        names = [bytes32.fromhex(name) for name in request_json["names"]]
+        return {
+            "coin_records": [self.coin_records[name].to_json_dict() for name in names if name in self.coin_records],
+            "success": True,
+        }
+
+
+class StubStore:
+    def __init__(self):
+        self.reward_scan_height: Optional[uint32] = None
+
+    async def get_reward_scan_height(self) -> Optional[uint32]:
+        return self.reward_scan_height
+
+    async def set_reward_scan_height(self, height: uint32) -> None:
+        self.reward_scan_height = height
+
+
+def scan_coins(coin_records: List[CoinRecord]) -> Set[Coin]:
+    return {coin_record.coin for coin_record in coin_records}
+
+
+class TestRewardScanner(unittest.TestCase):
+    def test_watermark(self):
+        async def run():
+            node, store = StubNode(), StubStore()
+            scanner = RewardScanner(node, store, uint32(0), 10, 100)
+            await scanner.start({PUZZLE_HASH_1})
+            coin_1 = node.add_coin(PUZZLE_HASH_1, 50)
+
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(100))) == {coin_1}
+            assert node.scans == [(1, 0)]
+            # Just below the unspent coin, rather than the buried height
+            assert store.reward_scan_height == 49
+
+            # The next scan starts after the buried height, and looks up the coin found before again
+            coin_2 = node.add_coin(PUZZLE_HASH_1, 95)
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(110))) == {coin_1, coin_2}
+            assert node.scans[-1] == (1, 91)
+            assert store.reward_scan_height == 49
+
+            # Once claimed, the coin is dropped and the watermark moves up to the oldest unspent coin
+            node.spend(coin_1, 111)
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(120))) == {coin_2}
+            assert node.scans[-1] == (1, 101)
+            assert store.reward_scan_height == 94
+            node.spend(coin_2, 121)
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(130))) == set()
+            assert store.reward_scan_height == 120
+
+            # After a restart, the scan starts from the persisted height
+            coin_3 = node.add_coin(PUZZLE_HASH_1, 125)
+            scanner = RewardScanner(node, store, uint32(0), 10, 100)
+            await scanner.start({PUZZLE_HASH_1})
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(130))) == {coin_3}
+            assert node.scans[-1] == (1, 121)
+
+            # Unless it is a full rescan
+            scanner = RewardScanner(node, store, uint32(0), 10, 100, True)
+            await scanner.start({PUZZLE_HASH_1})
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(130))) == {coin_3}
+            assert node.scans[-1] == (1, 0)
+
+        asyncio.run(run())
+
+    def test_reorg(self):
+        async def run():
+            node, store = StubNode(), StubStore()
+            scanner = RewardScanner(node, store, uint32(0), 10, 100)
+            await scanner.start({PUZZLE_HASH_1})
+            coin_1 = node.add_coin(PUZZLE_HASH_1, 95)
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(100))) == {coin_1}
+
+            # A reorg to a lower peak replaces the block of coin_1, and adds a coin below the last buried height
+            del node.coin_records[coin_1.name()]
+            coin_2 = node.add_coin(PUZZLE_HASH_1, 89)
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(98))) == {coin_2}
+            assert node.scans[-1] == (1, 89)
+            assert store.reward_scan_height == 88
+
+        asyncio.run(run())
+
+    def test_new_puzzle_hash(self):
+        async def run():
+            node, store = StubNode(), StubStore()
+            scanner = RewardScanner(node, store, uint32(5), 10, 1)
+            await scanner.start({PUZZLE_HASH_1})
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(100))) == set()
+
+            # A new farmer is scanned from scan_start_height, the others from the last buried height
+            coin_1 = node.add_coin(PUZZLE_HASH_1, 20)
+            coin_2 = node.add_coin(PUZZLE_HASH_2, 20)
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1, PUZZLE_HASH_2}, uint32(101))) == {coin_2}
+            assert node.scans[-2:] == [(1, 91), (1, 5)]
+            assert coin_1 not in scan_coins(await scanner.scan({PUZZLE_HASH_1, PUZZLE_HASH_2}, uint32(102)))
+
+            # A farmer that left is no longer returned
+            assert scan_coins(await scanner.scan({PUZZLE_HASH_1}, uint32(103))) == set()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
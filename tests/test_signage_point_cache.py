@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+
+from pool.signage_point_cache import SignagePointCache
+
+
+class FakeNode:
+    def __init__(self):
+        self.calls = 0
+        self.signage_points = {}
+
+    async def get_recent_signage_point_or_eos(self, sp_hash: bytes, is_eos: bool):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.signage_points.get((sp_hash, is_eos))
+
+
+class TestSignagePointCache(unittest.TestCase):
+    def test_concurrent_lookups_are_coalesced(self):
+        async def run():
+            node = FakeNode()
+            node.signage_points[(b"sp", False)] = {"reverted": False}
+            cache = SignagePointCache(node.get_recent_signage_point_or_eos, 600)
+            responses = await asyncio.gather(*[cache.get(b"sp", False) for _ in range(100)])
+            assert all(response == {"reverted": False} for response in responses)
+            assert node.calls == 1
+            await cache.get(b"sp", False)
+            assert node.calls == 1
+            await cache.get(b"sp", True)
+            assert node.calls == 2
+
+        asyncio.run(run())
+
+    def test_get_cached_does_not_fetch(self):
+        async def run():
+            node = FakeNode()
+            node.signage_points[(b"sp", False)] = {"reverted": False}
+            cache = SignagePointCache(node.get_recent_signage_point_or_eos, 600)
+            assert cache.get_cached(b"sp", False) is None
+            assert node.calls == 0
+            await cache.get(b"sp", False)
+            assert cache.get_cached(b"sp", False) == {"reverted": False}
+            cache.new_peak(b"peak")
+            assert cache.get_cached(b"sp", False) is None
+            assert node.calls == 1
+
+        asyncio.run(run())
+
+    def test_not_found_is_not_cached(self):
+        async def run():
+            node = FakeNode()
+            cache = SignagePointCache(node.get_recent_signage_point_or_eos, 600)
+            assert await cache.get(b"sp", False) is None
+            node.signage_points[(b"sp", False)] = {"reverted": False}
+            assert await cache.get(b"sp", False) == {"reverted": False}
+            assert node.calls == 2
+
+        asyncio.run(run())
+
+    def test_refreshed_on_new_peak(self):
+        async def run():
+            node = FakeNode()
+            node.signage_points[(b"sp", False)] = {"reverted": False}
+            cache = SignagePointCache(node.get_recent_signage_point_or_eos, 600)
+            cache.new_peak(b"peak1")
+            assert (await cache.get(b"sp", False))["reverted"] is False
+            node.signage_points[(b"sp", False)] = {"reverted": True}
+            assert (await cache.get(b"sp", False))["reverted"] is False
+            cache.new_peak(b"peak2")
+            assert (await cache.get(b"sp", False))["reverted"] is True
+            assert node.calls == 2
+
+        asyncio.run(run())
+
+    def test_expires_after_ttl(self):
+        async def run():
+            node = FakeNode()
+            node.signage_points[(b"sp", False)] = {"reverted": False}
+            cache = SignagePointCache(node.get_recent_signage_point_or_eos, 0)
+            await cache.get(b"sp", False)
+            await asyncio.sleep(0.01)
+            await cache.get(b"sp", False)
+            assert node.calls == 2
+            cache.new_peak(None)
+            assert cache.get_stats()["size"] == 0
+
+        asyncio.run(run())
+
+    def test_wait_wakes_up_when_found(self):
+        async def run():
+            node = FakeNode()
+            cache = SignagePointCache(node.get_recent_signage_point_or_eos, 600, 0.05)
+
+            async def add_later():
+                await asyncio.sleep(0.2)
+                node.signage_points[(b"sp", False)] = {"reverted": False}
+
+            asyncio.create_task(add_later())
+            start = asyncio.get_event_loop().time()
+            responses = await asyncio.gather(*[cache.wait(b"sp", False, 5) for _ in range(50)])
+            assert all(response == {"reverted": False} for response in responses)
+            assert asyncio.get_event_loop().time() - start < 1
+            assert cache.waiters == {}
+            # The first lookups are coalesced, then there is a single lookup per poll
+            assert node.calls < 10
+
+        asyncio.run(run())
+
+    def test_wait_times_out(self):
+        async def run():
+            node = FakeNode()
+            cache = SignagePointCache(node.get_recent_signage_point_or_eos, 600, 0.05)
+            assert await cache.wait(b"sp", False, 0.2) is None
+            assert await cache.wait(b"sp", False, -1) is None
+            assert cache.waiters == {}
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+import asyncio
+import unittest
+from typing import Dict, List, Optional, Set
+from unittest.mock import patch
+
+import aiohttp
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import SerializedProgram
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_record import CoinRecord
+from chia.types.coin_solution import CoinSolution
+from chia.util.ints import uint32, uint64
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from singleton import SingletonFollower, get_coin_records_by_names
+
+
+def make_coin_record(i: int, spent_height: int = 0) -> CoinRecord:
+    coin = Coin(bytes32(bytes([i]) * 32), bytes32(bytes([0xFF]) * 32), uint64(1))
+    return CoinRecord(coin, uint32(1), uint32(spent_height), spent_height > 0, False, uint64(0))
+
+
+class StubNode:
+    """
+    The coin record and coin spend RPCs of a full node that knows the coins in coin_records. Singletons are spent
+    with spend, which creates the next singleton coin, and the pool state of the spend. The singleton puzzles are
+    replaced by these, see follow_stub_singletons.
+    """
+
+    def __init__(self, coin_records: List[CoinRecord], by_names_status: int = 200):
+        self.coin_records: Dict[bytes32, CoinRecord] = {coin_record.name: coin_record for coin_record in coin_records}
+        self.by_names_status = by_names_status
+        self.calls: List[str] = []
+        self.next_coins: Dict[bytes32, Coin] = {}
+        self.pool_states: Dict[bytes32, Optional[str]] = {}
+        # Coins whose spend the node fails to return
+        self.failing_spends: Set[bytes32] = set()
+
+    def add_coin(self, coin: Coin, height: int) -> None:
+        self.coin_records[coin.name()] = CoinRecord(coin, uint32(height), uint32(0), False, False, uint64(0))
+
+    def spend(self, coin: Coin, height: int, pool_state: Optional[str]) -> Coin:
+        coin_record = self.coin_records[coin.name()]
+        self.coin_records[coin.name()] = CoinRecord(
+            coin, coin_record.confirmed_block_index, uint32(height), True, False, uint64(0)
+        )
+        next_coin = Coin(coin.name(), coin.puzzle_hash, coin.amount)
+        self.add_coin(next_coin, height)
+        self.next_coins[coin.name()] = next_coin
+        self.pool_states[coin.name()] = pool_state
+        return next_coin
+
+    def revert_spend(self, coin: Coin) -> None:
+        coin_record = self.coin_records[coin.name()]
+        self.coin_records[coin.name()] = CoinRecord(
+            coin, coin_record.confirmed_block_index, uint32(0), False, False, uint64(0)
+        )
+        del self.coin_records[self.next_coins.pop(coin.name()).name()]
+
+    async def get_puzzle_and_solution(self, coin_id: bytes32, height: uint32) -> Optional[CoinSolution]:
+        self.calls.append("get_puzzle_and_solution")
+        coin_record = self.coin_records.get(coin_id)
+        if coin_id in self.failing_spends or coin_record is None or coin_record.spent_block_index != height:
+            # Like FullNodeRpcClient, which returns None on any error
+            return None
+        return CoinSolution(
+            coin_record.coin, SerializedProgram.from_bytes(b"\x80"), SerializedProgram.from_bytes(b"\x80")
+        )
+
+    async def fetch(self, path: str, request_json: Dict) -> Dict:
+        self.calls.append(path)
+        if path == "get_coin_records_by_names":
+            if self.by_names_status != 200:
+                url = URL("https://localhost:8555/get_coin_records_by_names")
+                request_info = aiohttp.RequestInfo(url, "POST", CIMultiDictProxy(CIMultiDict()), url)
+                raise aiohttp.ClientResponseError(request_info, (), status=self.by_names_status)
+            return {
+                "coin_records": [
+                    self.coin_records[bytes32.fromhex(name)].to_json_dict()
+                    for name in request_json["names"]
+                    if bytes32.fromhex(name) in self.coin_records
+                ],
+                "success": True,
+            }
+        if path == "get_coin_record_by_name":
+            coin_record = self.coin_records.get(bytes32.fromhex(request_json["name"]))
+            if coin_record is None:
+                raise ValueError({"success": False, "error": "not found"})
+            return {"coin_record": coin_record.to_json_dict(), "success": True}
+        raise ValueError(path)
+
+
+class TestGetCoinRecordsByNames(unittest.TestCase):
+    def test_lookup(self):
+        async def run():
+            coin_records = [make_coin_record(i, i % 2) for i in range(5)]
+            names = [coin_record.name for coin_record in coin_records] + [bytes32(bytes(32))]
+            for status in [200, 404]:
+                node = StubNode(coin_records, status)
+                records = await get_coin_records_by_names(node, names, 2)
+                assert records == {coin_record.name: coin_record for coin_record in coin_records}
+                if status == 404:
+                    # Older full nodes do not have the endpoint, it is only tried once
+                    assert node.calls.count("get_coin_records_by_names") == 1
+                    assert node.calls.count("get_coin_record_by_name") == len(names)
+
+            # Other errors are not mistaken for a missing endpoint
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await get_coin_records_by_names(StubNode(coin_records, 500), names, 2)
+
+        asyncio.run(run())
+
+
+def follow_stub_singletons(node: StubNode):
+    return patch.multiple(
+        "singleton",
+        get_most_recent_singleton_coin_from_coin_solution=lambda solution: node.next_coins.get(solution.coin.name()),
+        solution_to_extra_data=lambda solution: node.pool_states.get(solution.coin.name()),
+    )
+
+
+def make_launcher(node: StubNode, i: int) -> Coin:
+    launcher = Coin(bytes32(bytes([i]) * 32), bytes32(bytes([0xEE]) * 32), uint64(1))
+    node.add_coin(launcher, 1)
+    return launcher
+
+
+class TestSingletonFollower(unittest.TestCase):
+    def test_follow(self):
+        async def run():
+            node = StubNode([])
+            launcher = make_launcher(node, 1)
+            coin_1 = node.spend(launcher, 1, "state 1")
+            coin_2 = node.spend(coin_1, 10, None)
+            coin_3 = node.spend(coin_2, 20, "state 3")
+            launcher_id = launcher.name()
+            follower = SingletonFollower(node, 5)
+            with follow_stub_singletons(node):
+                # The spend at height 20 is not buried yet, the spend at height 10 keeps the previous pool state
+                solution, pool_state = (await follower.get_singleton_states({launcher_id: None}, 22))[launcher_id]
+                assert solution.coin == coin_1 and pool_state == "state 1"
+                solution, pool_state = (await follower.get_singleton_states({launcher_id: None}, 22, 0))[launcher_id]
+                assert solution.coin == coin_2 and pool_state == "state 3"
+                assert follower.get_stale_launcher_ids(set()) == {launcher_id}
+
+                # Only the pending spend and the tip are looked up again, without fetching any spend
+                node.calls = []
+                solution, pool_state = (await follower.get_singleton_states({launcher_id: None}, 100))[launcher_id]
+                assert solution.coin == coin_2 and pool_state == "state 3"
+                assert node.calls == ["get_coin_records_by_names"] * 2
+                assert follower.get_stale_launcher_ids(set()) == set()
+                assert follower.get_stale_launcher_ids({coin_3.name()}) == {launcher_id}
+
+                # A new spend is walked from the tip
+                node.calls = []
+                coin_4 = node.spend(coin_3, 101, "state 4")
+                solution, pool_state = (await follower.get_singleton_states({launcher_id: None}, 102, 0))[launcher_id]
+                assert solution.coin == coin_3 and pool_state == "state 4"
+                assert node.calls.count("get_puzzle_and_solution") == 1
+                assert follower.launcher_by_tip == {coin_4.name(): launcher_id}
+
+        asyncio.run(run())
+
+    def test_reorg(self):
+        async def run():
+            node = StubNode([])
+            launcher = make_launcher(node, 1)
+            coin_1 = node.spend(launcher, 1, "state 1")
+            coin_2 = node.spend(coin_1, 20, "state 2")
+            launcher_id = launcher.name()
+            follower = SingletonFollower(node, 5)
+            with follow_stub_singletons(node):
+                solution, pool_state = (await follower.get_singleton_states({launcher_id: None}, 22, 0))[launcher_id]
+                assert solution.coin == coin_1 and pool_state == "state 2"
+
+                # The spend at height 20 is reorged out, the singleton is back to its previous coin
+                node.revert_spend(coin_1)
+                solution, pool_state = (await follower.get_singleton_states({launcher_id: None}, 22, 0))[launcher_id]
+                assert solution.coin == launcher and pool_state == "state 1"
+                assert follower.launcher_by_tip == {coin_1.name(): launcher_id}
+
+                # And spent again in the new chain
+                coin_2 = node.spend(coin_1, 21, "state 3")
+                solution, pool_state = (await follower.get_singleton_states({launcher_id: None}, 22, 0))[launcher_id]
+                assert solution.coin == coin_1 and pool_state == "state 3"
+                assert follower.launcher_by_tip == {coin_2.name(): launcher_id}
+
+        asyncio.run(run())
+
+    def test_failures(self):
+        async def run():
+            node = StubNode([])
+            launcher_1, launcher_2 = make_launcher(node, 1), make_launcher(node, 2)
+            node.spend(node.spend(launcher_1, 1, "state 1"), 10, None)
+            coin_2 = node.spend(launcher_2, 1, "state 2")
+            node.spend(coin_2, 10, "state 3")
+            unknown_launcher_id = bytes32(bytes([3]) * 32)
+            farmer_records = {launcher_1.name(): None, launcher_2.name(): None, unknown_launcher_id: None}
+            follower = SingletonFollower(node, 5)
+            with follow_stub_singletons(node):
+                # A failing spend lookup only leaves out its own singleton, and an unknown singleton is invalid
+                node.failing_spends.add(coin_2.name())
+                states = await follower.get_singleton_states(farmer_records, 100)
+                assert set(states.keys()) == {launcher_1.name(), unknown_launcher_id}
+                assert states[launcher_1.name()][1] == "state 1"
+                assert states[unknown_launcher_id] is None
+                assert follower.get_stale_launcher_ids(set()) == {launcher_2.name()}
+
+                # A failing batch lookup leaves out all the singletons
+                node.by_names_status = 500
+                assert await follower.get_singleton_states(farmer_records, 100) == {}
+                assert follower.get_stale_launcher_ids(set()) == {launcher_1.name(), launcher_2.name()}
+
+                # Once the node works again, the lookups carry on from what was followed
+                node.by_names_status = 200
+                node.failing_spends.clear()
+                states = await follower.get_singleton_states(farmer_records, 100)
+                assert states[launcher_1.name()][1] == "state 1"
+                assert states[launcher_2.name()] == (states[launcher_2.name()][0], "state 3")
+                assert states[launcher_2.name()][0].coin == coin_2
+                assert follower.get_stale_launcher_ids(set()) == set()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import random
+import tempfile
+import unittest
+
+from blspy import G1Element
+from chia.pools.pool_wallet_info import PoolState
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import SerializedProgram
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_solution import CoinSolution
+from chia.util.ints import uint8, uint32, uint64
+
+from store import FarmerRecord, PoolStore
+
+
+def make_farmer_record(launcher_id: bytes32, payout_instructions: str) -> FarmerRecord:
+    nil = SerializedProgram.from_bytes(b"\x80")
+    return FarmerRecord(
+        launcher_id,
+        bytes32(b"\x01" * 32),
+        uint64(3600),
+        bytes32(b"\x02" * 32),
+        G1Element(),
+        CoinSolution(Coin(launcher_id, bytes32(b"\x03" * 32), uint64(1)), nil, nil),
+        PoolState(uint8(1), uint8(3), bytes32(b"\x04" * 32), G1Element(), "https://pool.example", uint32(100)),
+        uint64(0),
+        uint64(1),
+        payout_instructions,
+        True,
+    )
+
+
+class TestPoolStore(unittest.TestCase):
+    def setUp(self):
+        # The database is created in the working directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_recent_partials(self):
+        async def run():
+            rnd = random.Random(1)
+            launcher_ids = [bytes32(bytes([i]) * 32) for i in range(3)]
+            timestamps = rnd.sample(range(1000, 100000), 200)
+            store = await PoolStore.create(partial_batch_size=30, recent_partials_size=10)
+
+            async def from_database(launcher_id: bytes32, count: int):
+                cursor = await store.connection.execute(
+                    "SELECT timestamp, difficulty from partial WHERE launcher_id=? ORDER BY timestamp DESC LIMIT ?",
+                    (launcher_id, count),
+                )
+                rows = await cursor.fetchall()
+                await cursor.close()
+                return [(timestamp, difficulty) for timestamp, difficulty in rows]
+
+            for timestamp in timestamps:
+                await store.add_partial(rnd.choice(launcher_ids), uint64(timestamp), uint64(rnd.randint(1, 100)))
+            # Some partials are still buffered, they are in the ring and added to the database reads
+            assert len(store.pending_partials) > 0
+            for launcher_id in launcher_ids:
+                recent = await store.get_recent_partials(launcher_id, 10)
+                assert len(recent) == 10
+                assert await store.get_recent_partials(launcher_id, 5) == recent[:5]
+                # More than the ring holds is read from the database
+                older = await store.get_recent_partials(launcher_id, 50)
+                assert older[:10] == recent
+                await store.flush_partials()
+                assert await from_database(launcher_id, 50) == older
+            assert await store.get_recent_partials(bytes32(b"\xff" * 32), 10) == []
+            await store.close()
+
+            # The ring is loaded from the database
+            store = await PoolStore.create(recent_partials_size=10)
+            for launcher_id in launcher_ids:
+                assert await store.get_recent_partials(launcher_id, 10) == await from_database(launcher_id, 10)
+            await store.close()
+
+        asyncio.run(run())
+
+    def test_points_epoch_payouts(self):
+        async def run():
+            store = await PoolStore.create()
+            address_1, address_2, address_3 = (bytes32(bytes([i]) * 32) for i in range(3))
+            payout_instructions = [address_1, address_1, address_2, address_3, address_3]
+            launcher_ids = [bytes32(bytes([0x10 + i]) * 32) for i in range(len(payout_instructions))]
+            for launcher_id, address in zip(launcher_ids, payout_instructions):
+                await store.add_farmer_record(make_farmer_record(launcher_id, address.hex()))
+            for launcher_id, points in zip(launcher_ids[:3], [10, 5, 7]):
+                await store.add_partial(launcher_id, uint64(1000), uint64(points))
+            await store.flush_partials()
+
+            epoch = await store.close_points_epoch()
+            # Counts towards the next epoch
+            await store.add_partial(launcher_ids[3], uint64(1000), uint64(4))
+            assert await store.get_points_epoch_total(epoch) == 22
+            chunks = [chunk async for chunk in store.get_points_epoch_payouts(epoch, 1)]
+            assert all(len(chunk) == 1 for chunk in chunks)
+            # Summed per payout instructions, without the farmers that have no points
+            assert sorted(chunk[0] for chunk in chunks) == [(7, address_2), (15, address_1)]
+            # Deleted over several transactions
+            await store.mark_points_epoch_paid(epoch, 2)
+            assert await store.get_points_epoch_total(epoch) == 0
+            await store.flush_partials()
+
+            next_epoch = await store.close_points_epoch()
+            assert next_epoch == epoch + 1
+            assert [chunk async for chunk in store.get_points_epoch_payouts(next_epoch, 10)] == [[(4, address_3)]]
+            await store.close()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()